@@ -1,21 +1,38 @@
+import collections
+import itertools
 import numpy as np
 import math
+import scipy.signal
 
 # this is the home for functions taking a speech signal and its cleaned pitch contour then returning glottal closure (or opening?) instants as time/power pairs.
 
-def find_instants(signal, contour, sampling_rate,frame_width=0.1):
+def find_instants(signal, contour, sampling_rate,frame_width=0.1, batch_size=1<<16):
+    """ Instants for every voiced region of the contour. Mark selection runs over batches of regions
+    holding about batch_size candidate marks, so only one batch's candidates are held at a time. """
     instants = []
+    choices = []
+    count = 0
     for start, end in contour.voiced_regions():
         print(start,end, int(start*sampling_rate),int(end*sampling_rate))
         # these are indices in the contour: convert to times
-        next_instants = find_voiced_instants(signal, contour, max(0,start-frame_width), end+frame_width, sampling_rate)
+        choices.append( find_voiced_choices(signal, contour, max(0,start-frame_width), end+frame_width, sampling_rate) )
+        count += len(choices[-1])
+        if count >= batch_size:
+            add_instants(instants, select_marks_batch(choices))
+            choices = []
+            count = 0
+    add_instants(instants, select_marks_batch(choices))
+    return instants
+
+def add_instants(instants, regions):
+    """ Append each region's selected marks to instants """
+    for next_instants in regions:
         # add an artificial zero-power instant at either end of the segment
         if len(next_instants) > 1:
             instants.append( (2*next_instants[0][0] - next_instants[1][0],0) )
         instants += next_instants
         if len(next_instants) > 1:
             instants.append( (2*next_instants[-1][0] - next_instants[-2][0],0) )
-    return instants
 
 def find_weighted_median(crossings):
     crossings.sort(key=lambda x: x[0]) # sort by pitch
@@ -66,8 +83,56 @@ def zfr(signal, pitch, sampling_rate):
       xs = filtered
     return xs
 
+def zfr_array(signal, pitch, sampling_rate):
+    """ As zfr, returning a float64 array: the resonators run through lfilter and the trend removal through convolution """
+    xs = np.diff(np.asarray(signal).astype(np.float64))
+    # 2, 3. two passes of y(n) = x(n) + 2y(n-1) - y(n-2), the first two samples passed through
+    resonator = ([1.0], [1.0, -2.0, 1.0])
+    for n in range(2):
+        if len(xs) > 2:
+            zi = scipy.signal.lfiltic(*resonator, [xs[1], xs[0]])
+            xs[2:] = scipy.signal.lfilter(*resonator, xs[2:], zi=zi)[0]
+    # 4. remove mean twice, with the same (edge clamped) windows as zfr
+    window_size = int(1.5 * sampling_rate / pitch)
+    half_window = window_size // 2
+    length = len(xs)
+    last = np.clip(np.arange(length) + half_window - 1, window_size-1, length-1)
+    lo = np.maximum(0, last-window_size+1)
+    for n in range(2):
+        # each window summed on its own: the resonator output grows roughly as n^3, so differences of a
+        # running total over a long region would lose most of their precision
+        if length >= window_size:
+            sums = np.convolve(xs, np.ones(window_size), 'valid')[lo]
+        else:
+            sums = np.full(length, xs.sum())
+        xs = xs - sums / window_size
+    return xs
+
+def upward_crossings(signal, start=1, end=None):
+    """ Indices i in [start,end) where signal[i-1] <= 0 and signal[i+1] >= 0: where marks may be moved to in the original signal.
+    Only that stretch of the signal is read. """
+    start = max(1, start)
+    end = len(signal)-1 if end is None else min(end, len(signal)-1)
+    if end <= start:
+        return np.zeros(0, dtype=np.int64)
+    samples = np.asarray(signal[start-1:end+1])
+    return np.flatnonzero((samples[:-2] <= 0) & (samples[2:] >= 0)) + start
+
+def rising_crossings(z):
+    """ Indices i where z[i] >= 0 and z[i-1] < 0 """
+    z = np.asarray(z)
+    return np.flatnonzero((z[1:] >= 0) & (z[:-1] < 0)) + 1
+
 def find_voiced_instants(signal, contour, start, end, sampling_rate):
     """ Find voiced instants from contour's voiced regions"""
+    choices = find_voiced_choices(signal, contour, start, end, sampling_rate)
+    if len(choices) < 2:
+        return choices
+    return select_marks(choices)
+
+def find_voiced_choices(signal, contour, start, end, sampling_rate, reach=100):
+    """ Candidate marks for the instants of one voiced region, as select_marks takes them.
+    Marks move to upward crossings of the original signal up to reach samples away."""
     # extract sub-signal
     start_index = math.floor(start * sampling_rate+0.5)
     end_index = math.floor(end * sampling_rate+0.5)
@@ -75,91 +140,97 @@ def find_voiced_instants(signal, contour, start, end, sampling_rate):
 
     # convert to ZFR using local pitch
     #print("local pitch:", contour.get_pitch( (end+start)/2 )," for voiced region at",(end+start)/2,"also:",contour.get_pitch(start),"-",contour.get_pitch(end))
-    z = zfr(sub_signal, contour.get_pitch( (end+start)/2 ),sampling_rate)
+    z = zfr_array(sub_signal, contour.get_pitch( (end+start)/2 ),sampling_rate)
     #print("Voiced region from ",start,"to",end," or ",start_index,"to",end_index)
 
     # select rising zero crossings: candidate list. Pair with power from the contour.
-    crossings = [(i,contour.get_power(start + i/sampling_rate)) for i,x in enumerate(z) if i > 0 and x >= 0 and z[i-1] < 0]
+    positions = rising_crossings(z)
+    crossings = list(zip(positions.tolist(), contour.get_powers(start + positions/sampling_rate).tolist()))
     
     #print("Found ",len(crossings)," zero crossings, or ",len(crossings)/(end-start) ,"Hz sampling rate of ",sampling_rate)
     if len(crossings) < 2:
         return crossings
-    # final test for pitch doublings: 5-width power-weighted median octave filter
-    prev_length = crossings[1][0] - crossings[0][0]
-    prev_cross = crossings[1]
-    i = 2
-    while i < len(crossings):
-        cross = crossings[i]
-        length = cross[0] - prev_cross[0]
+    crossings = clean_crossings(crossings)
+    # finally, in original signal-space, shift each crossing to one of two adjacent upward crossings
+    crossings = [c for c in crossings if c[1] != 0]
+    if not crossings:
+        return []
+    positions = np.array([c[0] for c in crossings], dtype=np.int64) + start_index
+    samples = np.asarray(signal)
+    exact = (samples[positions-1] < 0) & (samples[positions+1] > 0)
+    # the nearest upward crossings after and before each position. Only those within reach are used, so only
+    # the region (and reach either side of it) is searched: a position with none found there gets a stand-in
+    # beyond reach, the signal's ends when they are within reach, as a search of the whole signal would.
+    upward = upward_crossings(samples, positions.min()-reach, positions.max()+reach+1)
+    padded = np.append(upward, 0) # so no lookup is out of bounds, even with none found
+    after = np.searchsorted(upward, positions+1)
+    next_pos = np.where(after < len(upward), padded[after], np.maximum(len(samples)-1, positions+1))
+    before = np.searchsorted(upward, positions-1, side='right') - 1
+    prior_pos = np.where(before >= 0, padded[before], 0)
+    temporal_crossings = []
+    for c, pos, on_crossing, prior, following in zip(crossings, positions.tolist(), exact.tolist(), prior_pos.tolist(), next_pos.tolist()):
+        if on_crossing:
+            temporal_crossings.append( (pos, c[1]) )
+        elif prior < pos-reach:
+            if following > pos+reach:
+              temporal_crossings.append( (pos, c[1]) )
+            else:
+              temporal_crossings.append( (following, c[1]) )
+        elif following > pos+reach:
+          temporal_crossings.append( (prior, c[1]) )
+        else:
+          temporal_crossings.append( (prior, following, c[1]) )
+    return temporal_crossings
+    #return [(c[0] + start_index, c[1]) for c in crossings if c[1] != 0]
+
+def clean_crossings(crossings):
+    """ Final test for pitch doublings: 5-width power-weighted median octave filter over (position, power) crossings.
+    A single forward pass: cleaned crossings are appended to an output list while the rest wait in a queue,
+    so every merge or insertion only touches the ends of the two. """
+    if len(crossings) < 3:
+        return crossings
+    out = list(crossings[:2])
+    pending = collections.deque(crossings[2:])
+    prev_length = out[1][0] - out[0][0]
+    while pending:
+        cross = pending.popleft()
+        length = cross[0] - out[-1][0]
         # is it mismatched with prior?
         if prev_length > length*1.5 or prev_length*1.5 < length:
             # NOTE: this means i-2:i-1 is different from i-1:i
             # Test both directions around i-1 and decide which values need removing (never add)
-            win_start = max(0,i-3)
-            win_end = min(len(crossings),i+3)
+            near = out[-4:] + [cross] + list(itertools.islice(pending, 2))
             # find weighted median pitch period
-            candidates = [ (crossings[k][0]-crossings[k-1][0],(crossings[k-1][1]+crossings[k][1])/2) for k in range(win_start,win_end) if crossings[k][0] > crossings[k-1][0]]
+            candidates = [ (near[k][0]-near[k-1][0],(near[k-1][1]+near[k][1])/2) for k in range(1,len(near)) if near[k][0] > near[k-1][0]]
             w_median = find_weighted_median(candidates)
             # select the merge side that results in a value closest to the median:
             #  either i-2:i-1 with i-1:i  or i-1:i with i:i+1
-            if i < 2:
-                w1 = 0
-            else:
-                w1 = abs( w_median - (crossings[i][0] - crossings[i-2][0]) )
-            if i > len(crossings)-2:
+            w1 = abs( w_median - (cross[0] - out[-2][0]) )
+            if not pending:
                 w2 = 0
             else:
-                w2 = abs( w_median - (crossings[i+1][0] - crossings[i-1][0]) )
+                w2 = abs( w_median - (pending[0][0] - out[-1][0]) )
             if w1 < w_median//2 or w2 < w_median//2:
-              if w1 <=  w2: # merge into w1
-                crossings = crossings[:i-1]+crossings[i:]
-              else:
-                crossings = crossings[:i]+crossings[i+1:]
-              if i < len(crossings):
-                length = crossings[i][0] - crossings[i-1][0]
-                cross = crossings[i]
+              if w1 <= w2: # merge into w1
+                out[-1] = cross
+              if not pending:
+                break
+              # the following crossing is taken as it stands
+              cross = pending.popleft()
+              length = cross[0] - out[-1][0]
             elif length > w_median * 1.66: # needs to be a pretty clear pitch halving
+                prior = out[-1]
                 if length > w_median * 2.5: # thirding?!
-                  crossings = crossings[:i] + [ ( (crossings[i-1][0]*2+crossings[i][0])//3, (crossings[i-1][1]*2+crossings[i][1])/3), ((crossings[i-1][0]+2*crossings[i][0])//3, (crossings[i-1][1]+2*crossings[i][1])/3) ] + crossings[i:]
-                  
+                  inserted = [ ( (prior[0]*2+cross[0])//3, (prior[1]*2+cross[1])/3), ((prior[0]+2*cross[0])//3, (prior[1]+2*cross[1])/3) ]
                 else:
                   # consider an extra artificial instant
-                  crossings = crossings[:i] + [ ( (crossings[i-1][0]+crossings[i][0])//2, (crossings[i-1][1]+crossings[i][1])/2) ] + crossings[i:]
-                length = crossings[i][0] - crossings[i-1][0]
-                cross = crossings[i]
-        i += 1
-        prev_cross = cross
+                  inserted = [ ( (prior[0]+cross[0])//2, (prior[1]+cross[1])/2) ]
+                pending.extendleft(reversed(inserted[1:] + [cross])) # still to be checked
+                cross = inserted[0]
+                length = cross[0] - prior[0]
+        out.append(cross)
         prev_length = length
-    # finally, in original signal-space, shift each crossing to one of two adjacent upward crossings
-    temporal_crossings = []
-    #all_cs = []
-    for c in crossings:
-        if c[1] == 0:
-            continue
-        pos = c[0]+start_index
-        if signal[pos-1] < 0 and signal[pos+1] > 0:
-            temporal_crossings.append( (pos, c[1]) )
-        else:
-          next_pos = pos+1
-          while next_pos < len(signal)-1 and (signal[next_pos-1] > 0 or signal[next_pos+1] < 0):
-              next_pos += 1
-          prior_pos = pos-1
-          while prior_pos > 0 and (signal[prior_pos-1] > 0 or signal[prior_pos+1] < 0):
-              prior_pos -= 1
-          if prior_pos < pos-100:
-              if next_pos > pos+100:
-                temporal_crossings.append( (pos, c[1]) )
-              else:
-                temporal_crossings.append( (next_pos, c[1]) )
-          elif next_pos > pos+100:
-            temporal_crossings.append( (prior_pos, c[1]) )
-          else:
-            temporal_crossings.append( (prior_pos, next_pos, c[1]) )
-          #all_cs.append( (prior_pos, c[1]) )
-          #all_cs.append( (next_pos, c[1]) )
-          #print(prior_pos,next_pos)
-    return select_marks(temporal_crossings)
-    #return [(c[0] + start_index, c[1]) for c in crossings if c[1] != 0]
+    return out
 
 # two dynamic programming functions for best pitch and best pitch marks. Both optimise for smoothness.
 
@@ -192,3 +263,95 @@ def select_marks(choices):
       best.append( (end_state[1], choices[end_state[0]][-1]) )
       end_state = end_state[3] # prev
   return best[::-1] # reverse
+
+def select_marks_batch(regions, invalid=1<<62, min_regions=128):
+  """ select_marks for many regions at once, as arrays: each Viterbi step is one numpy operation across regions.
+  Every choice has two mark options (a single mark is repeated, its copy masked), each with a cost, the prior
+  option it came from and the pitch period leading to it. Regions of fewer than two choices give their first
+  marks unchanged.
+  The states of all regions are stored end to end, longest region first, so step i only works on the regions
+  still running: work and memory follow the number of marks, not the longest region times the region count.
+  A numpy step costs about as much as a hundred marks through select_marks, so regions longer than all but
+  min_regions others go through select_marks instead, and no step runs for fewer than that many marks' worth. """
+  lengths = np.array([len(r)-1 for r in regions], dtype=np.int64) # number of states in each region
+  results = [[(r[0][0], r[0][-1])] if len(r) == 1 else [] for r in regions]
+  active = np.flatnonzero(lengths >= 1)
+  if len(active) == 0:
+    return results
+  active = active[np.argsort(-lengths[active], kind='stable')]
+  if len(active) <= min_regions:
+    alone = len(active)
+  else:
+    alone = int(np.searchsorted(-lengths[active], -lengths[active[min_regions]], side='left'))
+  for r in active[:alone]:
+    results[r] = select_marks(regions[r])
+  active = active[alone:]
+  if len(active) == 0:
+    return results
+  sizes = lengths[active]
+  starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+  # marks[starts[k]+i] are the options for choices[i+1] of region active[k], as in select_marks
+  states = [cs for r in active for cs in regions[r][1:]]
+  marks = np.empty((len(states), 2), dtype=np.int64)
+  marks[:,0] = [cs[0] for cs in states]
+  marks[:,1] = [cs[-2] for cs in states]
+  valid = np.ones(marks.shape, dtype=bool)
+  valid[:,1] = np.fromiter(map(len, states), dtype=np.int64, count=len(states)) > 2
+  del states
+  def running(i):
+    """ How many regions have a state i: a prefix, as they are longest first """
+    return int(np.searchsorted(-sizes, -i, side='left'))
+  back = np.zeros(marks.shape, dtype=np.int64)
+  final = np.zeros(len(active), dtype=np.int64) # the cheapest option at each region's final state
+  layers = int(sizes[0])
+  if layers > 2:
+    # the first two states are free: the third picks the best of the four (second, first) pairings,
+    # listed in the order select_marks builds them
+    m1 = np.array([0,0,1,1])
+    m0 = np.array([0,1,0,1])
+    at = starts[:running(2)]
+    pair_period = marks[at+1][:,m1] - marks[at][:,m0]
+    pair_valid = valid[at+1][:,m1] & valid[at][:,m0]
+    delta = pair_period[:,None,:] - (marks[at+2][:,:,None] - marks[at+1][:,None,m1])
+    costs = np.where(pair_valid[:,None,:], delta*delta, invalid)
+    best = np.argmin(costs, axis=2)
+    back[at+2] = best
+    cost = np.where(valid[at+2], costs.min(axis=2), invalid)
+    period = marks[at+2] - np.take_along_axis(marks[at+1], m1[best], axis=1)
+    done = running(3)
+    final[done:len(at)] = np.argmin(cost[done:], axis=1)
+  for i in range(3, layers):
+    # cost is change in pitch period, from each prior option to each current one
+    at = starts[:running(i)]
+    cost, period = cost[:len(at)], period[:len(at)]
+    current, prior = marks[at+i], marks[at+i-1]
+    delta = period[:,None,:] - (current[:,:,None] - prior[:,None,:])
+    costs = delta*delta + cost[:,None,:]
+    best = np.argmin(costs, axis=2)
+    back[at+i] = best
+    cost = np.where(valid[at+i], costs.min(axis=2), invalid)
+    period = current - np.take_along_axis(prior, best, axis=1)
+    done = running(i+1)
+    final[done:len(at)] = np.argmin(cost[done:], axis=1)
+  # trace back from the cheapest final option
+  chosen = np.zeros(len(marks), dtype=np.int64)
+  option = final.copy()
+  for i in range(layers-1, 1, -1):
+    at = starts[:running(i)]
+    done = running(i+1)
+    option[done:len(at)] = final[done:len(at)]
+    chosen[at+i] = option[:len(at)]
+    option[:len(at)] = back[at+i, option[:len(at)]]
+  # option now indexes the pairing behind the third state
+  pair = np.where(sizes > 2, option, 0)
+  chosen[starts] = pair % 2
+  two = running(1)
+  chosen[starts[:two]+1] = pair[:two] // 2
+  selected = marks[np.arange(len(marks)), chosen].tolist()
+  for k, r in enumerate(active):
+    results[r] = list(zip(selected[starts[k]:starts[k]+sizes[k]], [cs[-1] for cs in regions[r][:-1]]))
+  return results
+
+def select_marks_array(choices):
+  """ select_marks as arrays, for one region """
+  return select_marks_batch([choices], min_regions=0)[0]
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+import pipeline
+import sig.audio as audio
+import sig.cache as cache
+import sig.tracks as tracks
+
+def find_wavs(paths):
+  """Expand directories into the wav files they contain"""
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      files += sorted(os.path.join(path,f) for f in os.listdir(path) if f.lower().endswith('.wav'))
+    else:
+      files.append(path)
+  return files
+
+def output_names(files, output_dir):
+  """Result file for each input: its path relative to the directory holding all the inputs, under output_dir,
+  so same-named files from different directories don't overwrite each other"""
+  paths = [os.path.abspath(f) for f in files]
+  root = os.path.commonpath([os.path.dirname(p) for p in paths]) if paths else ''
+  return [os.path.join(output_dir, os.path.splitext(os.path.relpath(p, root))[0] + '.instants.txt') for p in paths]
+
+def analyse_file(filename, output, cache_dir=None, cache_size=1<<30):
+  """Tracker -> contour -> instants for one file, writing the instants as main_instants.py prints them"""
+  start = time.time()
+  sampling_rate, data = audio.load(filename)
+  results = cache.ResultCache(cache_dir, cache_size) if cache_dir is not None else None
+  gis = pipeline.Pipeline(data, sampling_rate, results).instants()
+  os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+  with open(output, 'w') as f:
+    tracks.write_instants(gis, f)
+  return output, time.time()-start
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Find glottal instants for many wav files in parallel")
+  parser.add_argument('paths', nargs='+', help="wav files or directories of them")
+  parser.add_argument('-o', '--output', default='.', help="directory for the result files")
+  parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="worker processes")
+  parser.add_argument('-c', '--cache', help="directory to keep each stage's results in, reused across runs")
+  parser.add_argument('--cache-size', type=int, default=1024, help="cache size limit in megabytes")
+  args = parser.parse_args()
+
+  files = list(dict.fromkeys(os.path.abspath(f) for f in find_wavs(args.paths))) # each file once, however it was named
+  outputs = output_names(files, args.output)
+  clashes = sorted(o for o in set(outputs) if outputs.count(o) > 1) # e.g. a.wav and a.WAV
+  if clashes:
+    print("FAILED: more than one input would write", ", ".join(clashes), file=sys.stderr)
+    sys.exit(1)
+  failures = 0
+  start = time.time()
+  with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+    futures = {pool.submit(analyse_file, f, o, args.cache, args.cache_size<<20): f for f, o in zip(files, outputs)}
+    for future in concurrent.futures.as_completed(futures):
+      try:
+        output, seconds = future.result()
+        print("%.2fs" % seconds, futures[future], "->", output)
+      except Exception as e:
+        failures += 1
+        print("FAILED", futures[future], repr(e), file=sys.stderr)
+  print(len(files)-failures, "of", len(files), "files in %.2fs" % (time.time()-start))
+  sys.exit(1 if failures else 0)
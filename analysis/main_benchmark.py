@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import scipy.signal
+import pitch.contour as contour
+import pitch.tracker as tracker
+import glottal.instants as instants
+import sig.audio as audio
+import sig.synth as synth
+
+def synthetic(seconds, sampling_rate):
+  """A voiced-sounding test signal: a gliding harmonic series, with a short pause every two seconds.
+  There is a little background noise throughout, as in a recording (the tracker expects some signal energy)."""
+  t = np.arange(int(seconds*sampling_rate)) / sampling_rate
+  f0 = 140 + 40*np.sin(2*math.pi*0.3*t)
+  phase = 2*math.pi*np.cumsum(f0)/sampling_rate
+  xs = sum(np.sin(h*phase)/h for h in range(1,8) if h*200 < sampling_rate/2)
+  envelope = np.where((t % 2.0) < 1.7, 1.0, 0.0)
+  envelope = np.convolve(envelope, np.ones(256)/256, mode='same')
+  noise = np.random.default_rng(0).normal(0, 20, len(t))
+  return (xs*envelope*8000 + noise).astype(np.int16)
+
+def example(filename, seconds, sampling_rate):
+  """An example recording resampled to sampling_rate, repeated or cut to the given length"""
+  rate, data = audio.load(filename)
+  data = np.asarray(data, dtype=float)
+  if rate != sampling_rate:
+    g = math.gcd(rate, sampling_rate)
+    data = scipy.signal.resample_poly(data, sampling_rate//g, rate//g)
+  n = int(seconds*sampling_rate)
+  data = np.tile(data, n//len(data)+1)[:n]
+  return np.clip(data, -32768, 32767).astype(np.int16)
+
+def measure(run, memory=True, repeat=5):
+  """Result, wall seconds and peak traced memory in bytes (None if not measured) of calling run.
+  The time is the fastest of repeat calls, as single runs at this scale are mostly noise.
+  Tracing allocations slows everything down, so memory comes from a further, traced, call."""
+  with contextlib.redirect_stdout(io.StringIO()): # the stages print progress
+    seconds = math.inf
+    for _ in range(repeat):
+      result = None # so the previous result is freed before the next run
+      start = time.perf_counter()
+      result = run()
+      seconds = min(seconds, time.perf_counter()-start)
+    if not memory:
+      return result, seconds, None
+    del result
+    tracemalloc.start()
+    result = run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+  return result, seconds, peak
+
+def run_stages(data, sampling_rate, fast, memory=True, repeat=5):
+  """Time each stage in turn, feeding it the previous stage's output"""
+  timings = {}
+  if fast:
+    track = tracker.PitchTracker(40, vectorised=True)
+    (times, pitches, powers, _), timings['tracker'], mem = measure(lambda: track.track_batch_signal(data, sampling_rate), memory, repeat)
+  else:
+    track = tracker.PitchTracker(40)
+    rows, timings['tracker'], mem = measure(lambda: list(track.track_signal(data, sampling_rate)), memory, repeat)
+    times, pitches, powers = [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]
+  peaks = {'tracker': mem}
+  make_contour = contour.ArrayPitchContour if fast else contour.PitchContour
+  # the contour cleans its pitch argument in place, so each run gets its own copy
+  cont, timings['contour'], peaks['contour'] = measure(lambda: make_contour(times, pitches.copy(), powers), memory, repeat)
+  gis, timings['instants'], peaks['instants'] = measure(
+    lambda: instants.find_instants(data, cont, sampling_rate, 80.0/sampling_rate), memory, repeat)
+  synthesise = synth.sinusoid_f0_array if fast else synth.sinusoid_f0
+  if len(gis) > 1:
+    _, timings['synth'], peaks['synth'] = measure(lambda: synthesise(gis, sampling_rate), memory, repeat)
+  return timings, peaks
+
+def case(r, fast=False):
+  """What a result measured, to match it with the same case in another run.
+  Older result files only record fast once, for the whole run."""
+  return (r.get('fast', fast), r['source'], r['seconds'], r['sampling_rate'], r['stage'])
+
+def compare(results, baseline, tolerance):
+  """Print throughput against a baseline run, returning the number of cases that slowed beyond tolerance"""
+  previous = {case(r, baseline.get('fast', False)): r for r in baseline['results']}
+  slower = 0
+  for r in results:
+    old = previous.get(case(r))
+    if old is None:
+      continue
+    ratio = r['throughput']/old['throughput']
+    flag = ''
+    if ratio < 1-tolerance:
+      flag = ' SLOWER'
+      slower += 1
+    print("%-10s %5.1fs %6dHz %-9s %8.1fx -> %8.1fx (%.2f)%s" % (r['source'], r['seconds'], r['sampling_rate'], r['stage'],
+          old['throughput'], r['throughput'], ratio, flag))
+  return slower
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Time the tracker, contour, instants and synthesis stages")
+  parser.add_argument('-l', '--lengths', type=float, nargs='+', default=[2, 10], help="signal lengths in seconds")
+  parser.add_argument('-r', '--rates', type=int, nargs='+', default=[16000, 44100], help="sampling rates")
+  parser.add_argument('-e', '--examples', nargs='*', default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'test1.wav')], help="example wav files to use as well as synthetic audio")
+  parser.add_argument('-f', '--fast', action='store_true', help="use the numpy versions of each stage")
+  parser.add_argument('-n', '--no-memory', action='store_true', help="skip the (slow) traced runs for peak memory")
+  parser.add_argument('-R', '--repeat', type=int, default=5, help="timed runs of each stage, the fastest counting")
+  parser.add_argument('-o', '--output', help="write results as JSON")
+  parser.add_argument('-b', '--baseline', help="JSON from an earlier run to compare against")
+  parser.add_argument('-t', '--tolerance', type=float, default=0.2, help="fractional slowdown counted as a regression")
+  args = parser.parse_args()
+
+  sources = [('synthetic', None)] + [(os.path.basename(f), f) for f in args.examples]
+  results = []
+  for name, filename in sources:
+    for rate in args.rates:
+      for seconds in args.lengths:
+        data = synthetic(seconds, rate) if filename is None else example(filename, seconds, rate)
+        timings, peaks = run_stages(data, rate, args.fast, not args.no_memory, args.repeat)
+        for stage in timings:
+          results.append({'fast': args.fast, 'source': name, 'seconds': seconds, 'sampling_rate': rate, 'stage': stage,
+                          'time': timings[stage], 'throughput': seconds/timings[stage], 'peak_memory': peaks[stage]})
+          memory = "%8.1fMB" % (peaks[stage]/(1<<20)) if peaks[stage] is not None else ''
+          print("%-10s %5.1fs %6dHz %-9s %8.3fs %8.1fx realtime %s" % (name, seconds, rate, stage,
+                timings[stage], seconds/timings[stage], memory))
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'fast': args.fast, 'results': results}, f, indent=1)
+  if args.baseline:
+    with open(args.baseline) as f:
+      slower = compare(results, json.load(f), args.tolerance)
+    sys.exit(1 if slower else 0)
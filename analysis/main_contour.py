@@ -1,20 +1,31 @@
 #!/usr/bin/env python3
 
 import pitch.tracker as tracker
+import sig.audio as audio
+import sig.tracks as tracks
 import pitch.contour as contour
 import sys
 
 if __name__ == '__main__':
   if len(sys.argv) < 2:
-    print("Usage:",sys.argv[0],"<wav file>")
+    print("Usage:",sys.argv[0],"<wav file or track .npz> [contour .npz]")
     sys.exit(0)
-  track = tracker.PitchTracker(40)
-  times = []
-  pitches = []
-  powers = []
-  for t,pitch,power,voicing in track.track(sys.argv[1]):
-    times.append(t)
-    pitches.append(pitch)
-    powers.append(power)
+  if sys.argv[1].endswith('.npz'):
+    sampling_rate = tracks.sampling_rate(sys.argv[1])
+    times, pitches, powers, voicing = tracks.load_track(sys.argv[1])
+    times, pitches, powers = list(times), list(pitches), list(powers)
+  else:
+    sampling_rate, data = audio.load(sys.argv[1])
+    track = tracker.PitchTracker(40)
+    times = []
+    pitches = []
+    powers = []
+    for t,pitch,power,voicing in track.track_signal(data, sampling_rate):
+      times.append(t)
+      pitches.append(pitch)
+      powers.append(power)
   cont = contour.PitchContour(times, pitches, powers)
-  cont.print_out()
+  if len(sys.argv) > 2:
+    tracks.save_contour(sys.argv[2], cont, sampling_rate)
+  else:
+    cont.print_out()
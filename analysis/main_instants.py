@@ -1,28 +1,45 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+import pipeline
 import pitch.contour as contour
 import pitch.tracker as tracker
 import glottal.instants as instants
-import scipy.io.wavfile as wavfile 
+import sig.audio as audio
+import sig.cache as cache
+import sig.tracks as tracks
 
 if __name__ == '__main__':
   if len(sys.argv) < 2:
-    print("Usage:",sys.argv[0],"<wav file>")
+    print("Usage:",sys.argv[0],"<wav file> [track or contour .npz, or -] [instants .npz]")
+    print("Set ANALYSIS_CACHE to a directory to reuse the results of earlier runs")
     sys.exit(0)
-  track = tracker.PitchTracker(40)
-  times = []
-  pitches = []
-  powers = []
-  for t,pitch,power,voicing in track.track(sys.argv[1]):
-    times.append(t)
-    pitches.append(pitch)
-    powers.append(power)
-  cont = contour.PitchContour(times, pitches, powers)
-  # reload original file
-  sampling_rate, data = wavfile.read(sys.argv[1])
-  frame_width = 40.0 / sampling_rate
-  gis = instants.find_instants(data, cont, sampling_rate, frame_width*2)
+  sampling_rate, data = audio.load(sys.argv[1])
+  stored = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] != '-' else None
+  if stored is None and os.environ.get('ANALYSIS_CACHE'):
+    gis = pipeline.Pipeline(data, sampling_rate, cache.ResultCache(os.environ['ANALYSIS_CACHE'])).instants()
+  else:
+    if stored is not None and tracks.kind(stored) == 'contour':
+      cont = contour.PitchContour.cleaned(*tracks.load_contour(stored))
+    else:
+      if stored is not None:
+        times, pitches, powers, voicing = tracks.load_track(stored)
+        times, pitches, powers = list(times), list(pitches), list(powers)
+      else:
+        track = tracker.PitchTracker(40)
+        times = []
+        pitches = []
+        powers = []
+        for t,pitch,power,voicing in track.track_signal(data, sampling_rate):
+          times.append(t)
+          pitches.append(pitch)
+          powers.append(power)
+      cont = contour.PitchContour(times, pitches, powers)
+    frame_width = 40.0 / sampling_rate
+    gis = instants.find_instants(data, cont, sampling_rate, frame_width*2)
 
-  for i in gis:
-      print(i[0],i[1])
+  if len(sys.argv) > 3:
+    tracks.save_instants(sys.argv[3], gis, sampling_rate)
+  else:
+    tracks.write_instants(gis)
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
 import pitch.tracker as tracker
+import sig.audio as audio
+import sig.tracks as tracks
 
 import sys
 if __name__ == '__main__':
   if len(sys.argv) < 2:
-    print("Usage:",sys.argv[0],"<wav file>")
+    print("Usage:",sys.argv[0],"<wav file> [track .npz]")
     sys.exit(0)
+  sampling_rate, data = audio.load(sys.argv[1])
   track = tracker.PitchTracker(40)
-  for t,pitch,power,voicing in track.track(sys.argv[1]):
+  if len(sys.argv) > 2:
+    times, pitches, powers, voicing = track.track_batch_signal(data, sampling_rate)
+    tracks.save_track(sys.argv[2], times, pitches, powers, voicing, sampling_rate)
+    sys.exit(0)
+  for t,pitch,power,voicing in track.track_signal(data, sampling_rate):
     print(t,pitch,power,voicing)
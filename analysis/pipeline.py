@@ -0,0 +1,73 @@
+import contextlib
+import io
+import pitch.contour as contour
+import pitch.tracker as tracker
+import glottal.instants as instants
+import sig.cache as cache
+import sig.tracks as tracks
+
+class Pipeline:
+  """ Tracker -> contour -> instants for one signal, as the main_*.py scripts run them.
+  Given a sig.cache.ResultCache, each stage first looks for its own output under a key built from the audio
+  and the parameters of it and every earlier stage, and otherwise reuses the previous stage's output. """
+  def __init__(self, data, sampling_rate, results=None, analysis_frequency=40, note_factor=1, local_width=5, frame_width=None):
+    self.data = data
+    self.sampling_rate = sampling_rate
+    self.results = results
+    self.analysis_frequency = analysis_frequency
+    self.note_factor = note_factor
+    self.local_width = local_width
+    self.frame_width = frame_width if frame_width is not None else 80.0 / sampling_rate
+    self.audio_key = None
+
+  def key(self, stage):
+    if self.audio_key is None:
+      self.audio_key = cache.audio_key(self.data, self.sampling_rate)
+    key = cache.stage_key(self.audio_key, 'track', analysis_frequency=self.analysis_frequency, note_factor=self.note_factor)
+    if stage == 'track':
+      return key
+    key = cache.stage_key(key, 'contour', local_width=self.local_width)
+    if stage == 'contour':
+      return key
+    return cache.stage_key(key, 'instants', frame_width=self.frame_width)
+
+  def stored(self, stage):
+    if self.results is None:
+      return None
+    return self.results.load(self.key(stage), stage)
+
+  def track(self):
+    """ times, pitches, powers, voicing arrays """
+    columns = self.stored('track')
+    if columns is not None:
+      return columns['times'], columns['pitches'], columns['powers'], columns['voicing']
+    track = tracker.PitchTracker(self.analysis_frequency, vectorised=True)
+    track.setup(self.sampling_rate, self.note_factor)
+    times, pitches, powers, voicing = track.track_batch_signal(self.data, self.sampling_rate)
+    if self.results is not None:
+      self.results.save(self.key('track'), 'track', self.sampling_rate, times=times, pitches=pitches, powers=powers, voicing=voicing)
+    return times, pitches, powers, voicing
+
+  def contour(self):
+    """ The cleaned ArrayPitchContour """
+    columns = self.stored('contour')
+    if columns is not None:
+      return contour.ArrayPitchContour.cleaned(columns['times'], columns['pitch'], columns['power'], self.local_width)
+    times, pitches, powers, voicing = self.track()
+    with contextlib.redirect_stdout(io.StringIO()): # the cleanup prints its statistics
+      cont = contour.ArrayPitchContour(times, pitches, powers, self.local_width)
+    if self.results is not None:
+      self.results.save(self.key('contour'), 'contour', self.sampling_rate, times=cont.times, pitch=cont.pitch, power=cont.power)
+    return cont
+
+  def instants(self):
+    """ (sample position, strength) glottal instants """
+    columns = self.stored('instants')
+    if columns is not None:
+      return tracks.instant_pairs(columns)
+    cont = self.contour()
+    with contextlib.redirect_stdout(io.StringIO()): # and so does the instant search, per region
+      gis = instants.find_instants(self.data, cont, self.sampling_rate, self.frame_width)
+    if self.results is not None:
+      self.results.save(self.key('instants'), 'instants', self.sampling_rate, **tracks.instant_columns(gis))
+    return gis
@@ -1,11 +1,17 @@
 import math
+import numpy as np
+import pitch.pitch as anp
+import pitch.rolling as rolling
 
 class PitchContour:
-    def __init__(self, times, pitch, power):
+    rolling_width = 16 # widest local_width estimated by sorting each window directly
+    def __init__(self, times, pitch, power, local_width=5, note_factor=1):
         self.pitch = pitch
         self.power = power
         self.times = times
         self.window_size = (times[-1]-times[0])/len(times)
+        self.local_width = local_width # frames either side for local pitch estimates
+        self.note_factor = note_factor # the tracker's note grid, used to bin pitch values
 
         # find weighted mode of pitch values
         self.mid_pitch = self.find_mode()
@@ -68,27 +74,7 @@ class PitchContour:
             self.pitch[i] = p
 
         # clean up local pitch halvings and doublings, and zero any unclear
-        for i, p in enumerate(self.pitch):
-            if p == 0:
-                continue
-            # look forward and back to estimate pitch
-            estimate, support = self.estimate_local(i)
-            if estimate == 0 or support < self.high_power/8: # poor local pitch estimates
-                #if self.power[i] < self.high_power/20:
-                self.pitch[i] = 0
-                continue
-            if p/estimate < 0.8:
-              while p/estimate < 0.66:
-                p *= 2
-              self.pitch[i] = p
-              #if p/estimate < 0.8: # still far off
-              #  self.pitch[i] = 0
-            elif p/estimate > 1.25:
-              while p/estimate > 1.5:
-                p /= 2
-              self.pitch[i] = p
-              #if p/estimate > 1.25: # too distant
-              #  self.pitch[i] = 0
+        self.clean_local()
 
         # TODO a final step: find any remaining doublings/halvings that appear as steps in adjacent pitch (skipping zeroes that will later be spanned by interpolation)
         # for each step up, see if there is a corresponding step down. Adjust a whole segment if this is found.
@@ -163,6 +149,48 @@ class PitchContour:
         np.append(self.pitch[-1])
         self.pitch = np
 
+    def clean_local(self):
+        """Local halvings and doublings, zeroing poorly supported frames, one frame at a time.
+        Windows wider than rolling_width slide a rolling median along instead of sorting each one."""
+        window = None
+        if self.local_width > self.rolling_width:
+            window = rolling.SlidingWeightedMedian(self.power, lambda j: self.pitch[j] > 0)
+        for i, p in enumerate(self.pitch):
+            if p == 0:
+                continue
+            # look forward and back to estimate pitch
+            estimate, support = self.estimate_local(i, window)
+            if estimate == 0 or support < self.high_power/8: # poor local pitch estimates
+                #if self.power[i] < self.high_power/20:
+                self.pitch[i] = 0
+                if window is not None:
+                    window.discard(i)
+                continue
+            if p/estimate < 0.8:
+              while p/estimate < 0.66:
+                p *= 2
+              self.pitch[i] = p
+              #if p/estimate < 0.8: # still far off
+              #  self.pitch[i] = 0
+            elif p/estimate > 1.25:
+              while p/estimate > 1.5:
+                p /= 2
+              self.pitch[i] = p
+              #if p/estimate > 1.25: # too distant
+              #  self.pitch[i] = 0
+
+    @classmethod
+    def cleaned(cls, times, pitch, power, local_width=5, note_factor=1):
+        """A contour from already cleaned pitch (e.g. from sig.tracks.load_contour), skipping the cleanup"""
+        contour = cls.__new__(cls)
+        contour.times = list(times)
+        contour.pitch = list(pitch)
+        contour.power = list(power)
+        contour.window_size = (contour.times[-1]-contour.times[0])/len(contour.times)
+        contour.local_width = local_width
+        contour.note_factor = note_factor
+        return contour
+
     def get_pitch(self, time):
         index = int((time-self.times[0])/self.window_size)
         # window size can be slightly off, so for large multiples check rounding
@@ -184,15 +212,38 @@ class PitchContour:
         fraction = (time-self.times[index])/self.window_size
         return self.power[index]*(1.0-fraction) + self.power[index+1]*fraction
 
-    def estimate_local(self, i):
-        """Estimate pitch from 10 neightbouring pitch marks"""
-        start = max(0,i-5)
-        end = min(len(self.pitch)-1,i+5)
+    def get_powers(self, times):
+        """get_power for an array of times"""
+        times = np.asarray(times, dtype=float)
+        contour_times = np.asarray(self.times, dtype=float)
+        power = np.asarray(self.power, dtype=float)
+        n = len(power)
+        index = ((times-contour_times[0])/self.window_size).astype(int)
+        # window size can be slightly off, so for large multiples check rounding
+        index -= (index > 0) & (contour_times[np.minimum(index,n-1)] > times)
+        inside = index < n-1
+        i = np.where(inside, index, 0)
+        fraction = (times-contour_times[i])/self.window_size
+        powers = power[i]*(1.0-fraction) + power[i+1]*fraction
+        return np.where(inside, powers, np.where(index == n-1, power[-1], 0.0))
+
+    def estimate_local(self, i, window=None):
+        """Estimate pitch from the local_width neighbouring pitch marks either side.
+        window is a rolling.SlidingWeightedMedian over the voiced frames, for wide windows"""
+        start = max(0,i-self.local_width)
+        end = min(len(self.pitch)-1,i+self.local_width)
         # power-weighted median
-        total_power = 0
-        weighted = 0
         # TODO: but we should weigh by power and distance incase of highly varying pitch?
+        if window is not None:
+            window.slide(start, end)
+            median = window.median()
+            if median is None:
+                return 0,0
+            return self.pitch[median],window.total
+        total_power = 0
         ps = [(a,b) for a,b in zip(self.pitch[start:end+1],self.power[start:end+1]) if a > 0]
+        if not ps:
+            return 0,0
         ps.sort(key=lambda x: x[1]) # sorted by power
         for p in ps:
             total_power += p[1]
@@ -204,53 +255,34 @@ class PitchContour:
                 return p[0],total_power
         return ps[-1][0],total_power
 
+    def pitch_grid(self):
+        """Bins for the weighted modes: no pitch, the tracker's notes, then anything else present"""
+        return [0] + anp.make_notes(self.note_factor) + list(self.pitch)
+
     def find_mode(self):
-        counts = {}
-        for pt,pw in zip(self.pitch,self.power):
-            if not pt in counts:
-                counts[pt] = pw
-            else:
-                counts[pt] += pw
+        counts = rolling.RollingMode(self.pitch_grid())
+        counts.add_all(self.pitch,self.power)
         # just pick the single highest bin
-        mode = max(counts, key=lambda x: counts[x])
-        #bins = [ (p,counts[p]) for p in counts]
-        #mode = max(bins, key=lambda x: x[1])
-        return mode
+        return counts.mode()
 
     def find_drift_modes(self, window_size=1.0, step=0.25):
         # convert to indices
         window_size = math.floor(window_size/self.window_size)+1
         step = math.floor(step/self.window_size)+1
         # initialise counts
-        counts = {}
-        power = 0
-        for pt,pw in zip(self.pitch[:window_size],self.power[:window_size]):
-            if not pt in counts:
-                counts[pt] = pw
-            else:
-                counts[pt] += pw
-            power += pw
-        modes = [max(counts, key=lambda x: counts[x])]
+        counts = rolling.RollingMode(self.pitch_grid())
+        counts.add_all(self.pitch[:window_size],self.power[:window_size])
+        power = sum(self.power[:window_size])
+        modes = [counts.mode()]
         powers = [power]
         # step through
         start = 0
         while start+window_size+step < len(self.pitch):
-            index = 0
-            while index < step:
-                # remove
-                pw = self.power[start+index]
-                counts[ self.pitch[start+index] ] -= pw
-                power -= pw
-                # and add
-                pt = self.pitch[start+index+window_size]
-                pw = self.power[start+index+window_size]
-                if not pt in counts:
-                    counts[pt] = pw
-                else:
-                    counts[pt] += pw
-                power += pw
-                index += 1
-            modes.append( max(counts, key=lambda x: counts[x]) )
+            end = start+window_size
+            counts.slide(self.pitch[start:start+step],self.power[start:start+step],self.pitch[end:end+step],self.power[end:end+step])
+            for index in range(step):
+                power = power - self.power[start+index] + self.power[end+index]
+            modes.append(counts.mode())
             powers.append(power)
             start += step
         return modes,powers
@@ -278,3 +310,385 @@ class PitchContour:
         if in_region:
           yield self.times[start], self.times[-1]
 
+
+class ArrayPitchContour(PitchContour):
+    """The same cleanup as PitchContour, with each pass done as numpy array operations.
+    pitch, power and times are held as arrays."""
+    chunk_frames = 4096 # frames cleaned together
+    def __init__(self, times, pitch, power, local_width=5):
+        self.pitch = np.array(pitch, dtype=float)
+        self.power = np.array(power, dtype=float)
+        self.times = np.array(times, dtype=float)
+        self.window_size = (self.times[-1]-self.times[0])/len(self.times)
+        self.local_width = local_width
+
+        self.mid_pitch = self.find_mode()
+        print(self.mid_pitch," Hz")
+
+        self.drift_pitch, self.drift_power = self.find_drift_modes()
+        drift_step = math.floor(0.25/self.window_size)
+
+        self.high_power = self.find_upper_power()
+        print(self.high_power," power")
+
+        # zero low-power pitch entries, and interpolate the drift across its low-power windows
+        self.pitch[self.power < self.high_power/50] = 0
+        self.drift_pitch[self.drift_power < self.drift_power.max()/10] = 0
+        known = np.flatnonzero(self.drift_pitch)
+        self.drift_pitch = np.interp(np.arange(len(self.drift_pitch)), known, self.drift_pitch[known])
+
+        # global halvings and doublings against the drift
+        drift_index = np.clip((np.arange(len(self.pitch))-drift_step//2) // drift_step, 0, len(self.drift_pitch)-1)
+        drifted = self.drift_pitch[drift_index]
+        fold_octaves(self.pitch, self.pitch > 0, drifted*0.66, drifted*1.5)
+
+        self.clean_local()
+        self.interpolate_gaps()
+        self.smooth()
+
+    @classmethod
+    def cleaned(cls, times, pitch, power, local_width=5, note_factor=1):
+        contour = super().cleaned(times, pitch, power, local_width, note_factor)
+        contour.times, contour.pitch, contour.power = (np.array(a, dtype=float) for a in (times, pitch, power))
+        return contour
+
+    def find_mode(self):
+        values, first, inverse = np.unique(self.pitch, return_index=True, return_inverse=True)
+        counts = np.bincount(inverse, weights=self.power)
+        # ties go to the pitch seen first, as with a dictionary
+        best = np.flatnonzero(counts == counts.max())
+        return values[best[np.argmin(first[best])]]
+
+    def find_drift_modes(self, window_size=1.0, step=0.25):
+        window_size = math.floor(window_size/self.window_size)+1
+        step = math.floor(step/self.window_size)+1
+        n = len(self.pitch)
+        # distinct pitches ranked in order of first appearance, as a dictionary would hold them
+        values, first, inverse = np.unique(self.pitch, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        ranks = rank[inverse.reshape(-1)]
+        seen = np.searchsorted(first[order], np.arange(n+1)) # pitches appearing before each frame
+        starts = np.arange(0, max(0, n-window_size-1)//step + 1)*step
+        starts = starts[(starts == 0) | (starts+window_size < n)]
+        modes = np.empty(len(starts))
+        powers = np.empty(len(starts))
+        # power per pitch for a block of windows at a time, so memory follows the block rather than the track
+        block = 1024
+        offsets = np.arange(window_size)
+        for a in range(0, len(starts), block):
+            s = starts[a:a+block]
+            index = s[:,None] + offsets[None,:]
+            inside = index < n
+            index = np.minimum(index, n-1)
+            rows = np.broadcast_to(np.arange(len(s))[:,None], index.shape)
+            counts = np.bincount((rows*len(values) + ranks[index])[inside], weights=self.power[index][inside],
+                                 minlength=len(s)*len(values)).reshape(len(s), len(values))
+            # only pitches seen by the end of the window can be the mode; ties go to the first seen
+            end = seen[np.minimum(s+window_size, n)]
+            counts[np.arange(len(values))[None,:] >= end[:,None]] = -np.inf
+            modes[a:a+block] = values[order][np.argmax(counts, axis=1)]
+            powers[a:a+block] = np.where(np.isinf(counts), 0, counts).sum(axis=1)
+        return modes, powers
+
+    def find_upper_power(self):
+        spower = np.sort(self.power[self.power > 0])
+        return spower[len(spower)-1-len(spower)//20]
+
+    def clean_local(self):
+        """ Local halvings and doublings, zeroing poorly supported frames.
+        Each frame's estimate sees the already cleaned frames before it, as in PitchContour. That dependency
+        is resolved by re-evaluating every frame of a chunk until nothing changes: after k rounds the first k frames
+        are final. Each round sorts a (frames x 2*local_width+1) matrix, so wide windows go frame by frame through
+        PitchContour's sliding median instead, which gives the same result. """
+        if self.local_width > self.rolling_width:
+            pitch, power = self.pitch, self.power
+            self.pitch, self.power = pitch.tolist(), power.tolist() # faster to index one at a time
+            PitchContour.clean_local(self)
+            self.pitch, self.power = np.array(self.pitch, dtype=float), power
+            return
+        old = self.pitch
+        n = len(old)
+        offsets = np.arange(-self.local_width, self.local_width+1)
+        before = offsets < 0
+        limit = self.high_power/8
+        new = old.copy()
+        # a chunk at a time: frames before the chunk are already final, so memory stays bounded
+        for a in range(0, n, self.chunk_frames):
+            b = min(n, a+self.chunk_frames)
+            index = np.arange(a,b)[:,None] + offsets[None,:]
+            inside = (index >= 0) & (index < n)
+            index = np.clip(index, 0, n-1)
+            powers = self.power[index]
+            todo = old[a:b] != 0
+            while True:
+                ps = np.where(before, new[index], old[index])
+                estimate, support = weighted_medians(ps, powers, inside & (ps > 0))
+                result = old[a:b].copy()
+                result[todo & ((estimate == 0) | (support < limit))] = 0
+                keep = todo & (result != 0)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ratio = result/estimate
+                fold_octaves(result, keep & (ratio < 0.8), 0.66, np.inf, estimate)
+                fold_octaves(result, keep & (ratio > 1.25), 0, 1.5, estimate)
+                if np.array_equal(result, new[a:b]):
+                    break
+                new[a:b] = result
+        self.pitch = new
+
+    def interpolate_gaps(self):
+        """ Fill short zero runs from the nearest pitch either side, weighted by distance """
+        n = len(self.pitch)
+        positions = np.arange(n)
+        voiced = self.pitch != 0
+        prev_index = np.maximum.accumulate(np.where(voiced, positions, -1))
+        next_index = np.minimum.accumulate(np.where(voiced, positions, n)[::-1])[::-1]
+        forward = np.where(prev_index >= 0, self.pitch[np.maximum(prev_index,0)], 0)
+        back = np.where(next_index < n, self.pitch[np.minimum(next_index,n-1)], 0)
+        df = positions - prev_index
+        db = next_index - positions
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = forward/back
+            filled = (forward/df + back/db) / (1/df + 1/db)
+        # no interpolation across long gaps, or when close to pitch doubling
+        gaps = ~voiced & (df+db <= 4) & (ratio >= 0.66) & (ratio <= 1.5)
+        self.pitch[gaps] = filled[gaps]
+
+    def smooth(self):
+        """ Power-weighted triangular smoothing over 5 frames, ignoring zero pitch """
+        n = len(self.pitch)
+        if n < 5:
+            return
+        ps = np.lib.stride_tricks.sliding_window_view(self.pitch, 5)
+        ws = np.lib.stride_tricks.sliding_window_view(self.power, 5) * np.array([1,2,3,2,1])
+        total = np.zeros(n-4)
+        weight = np.zeros(n-4)
+        for k in range(5): # accumulated in the same order as PitchContour
+            total = total + ps[:,k]*ws[:,k]
+            weight = weight + np.where(ps[:,k] != 0, ws[:,k], 0)
+        centre = ps[:,2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            smoothed = np.where(centre == 0, 0, total/weight)
+        self.pitch = np.concatenate((self.pitch[:2], smoothed, self.pitch[-2:]))
+
+    def voiced_regions(self):
+        """ Start time, end time,generator across contiguous voiced regions."""
+        voiced = np.concatenate(([False], self.pitch > 0, [False]))
+        edges = np.flatnonzero(voiced[1:] != voiced[:-1])
+        for start, end in zip(edges[::2], edges[1::2]):
+            yield self.times[start], self.times[end-1]
+
+def weighted_medians(ps, powers, included):
+    """ Power-weighted median of each row of ps over the included entries, and each row's included power.
+    Summed in ascending power order to match PitchContour.estimate_local. """
+    keys = np.where(included, powers, np.inf)
+    order = np.argsort(keys, axis=1, kind='stable') # excluded entries sort last
+    ps = np.take_along_axis(ps, order, axis=1)
+    ws = np.take_along_axis(np.where(included, powers, 0), order, axis=1)
+    count = included.sum(axis=1)
+    total = np.zeros(len(ps))
+    for k in range(ps.shape[1]):
+        total = total + ws[:,k]
+    remaining = total/2
+    found = np.zeros(len(ps), dtype=bool)
+    median = ps[np.arange(len(ps)), np.maximum(count-1,0)] # the largest power, if never reached
+    for k in range(ps.shape[1]):
+        remaining = remaining - ws[:,k]
+        hit = ~found & (k < count) & (remaining <= 0)
+        median[hit] = ps[hit,k]
+        found |= hit
+    median[count == 0] = 0
+    return median, total
+
+def fold_octaves(pitch, mask, low, high, scale=1):
+    """ In place, double pitch[mask] while pitch/scale is below low then halve it while above high.
+    low, high and scale may be arrays aligned with pitch. """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while True:
+            m = mask & (pitch > 0) & (pitch/scale < low)
+            if not m.any():
+                break
+            pitch[m] *= 2
+        while True:
+            m = mask & (pitch/scale > high)
+            if not m.any():
+                break
+            pitch[m] /= 2
+
+class StreamingPitchContour:
+    """ PitchContour's cleanup for live input. Tracker frames go in one at a time through add(), and each
+    comes back out cleaned, as (time, pitch, power), a fixed number of frames later; finish() flushes the rest.
+    Pitches are expected on the tracker's note grid (or 0), as track_stream produces them.
+    Whole-track statistics become running ones: the upper power level comes from a quantile sketch of every
+    frame so far, the global mode is that of every voiced frame so far, and the drift is the mode of a trailing
+    window ending at the newest frame (rather than one mostly ahead of each frame), folded to within an octave
+    of the global mode. The local, gap filling and smoothing passes are those of PitchContour, each run as
+    soon as the frames it looks ahead to are ready, and only a window of recent frames is kept.
+    Against PitchContour on the two examples, 11% (test1) and 5% (test2) of its voiced frames come out more
+    than 10% away, mostly where one of the two has an octave error the other avoided. A shorter lookahead
+    leaves the drift further behind: at 0.3 s it is 20% and 7%. """
+    def __init__(self, frame_rate=40, lookahead=0.5, drift_window=1.0, local_width=5, note_factor=1):
+        self.local_width = local_width
+        # frames held back: enough for the local, gap filling and smoothing passes at least
+        self.lookahead = max(math.ceil(lookahead*frame_rate), local_width+5)
+        self.drift_size = math.floor(drift_window*frame_rate)+1
+        self.drift = rolling.RollingMode([0] + anp.make_notes(note_factor))
+        self.drift_power = 0
+        self.max_drift_power = 0
+        self.drift_pitch = 0 # latest drift mode with enough power behind it
+        self.voiced = rolling.RollingMode([0] + anp.make_notes(note_factor)) # every voiced frame so far
+        self.mid_pitch = 0
+        self.powers = rolling.QuantileSketch()
+        self.high_power = 0
+        # recent frames, indexed from self.base. Each pass appends to its own list.
+        self.base = 0
+        self.times = []
+        self.raw = []
+        self.power = []
+        self.folded = [] # global halvings and doublings removed
+        self.local = [] # local halvings and doublings removed
+        self.filled = [] # short gaps interpolated
+        self.released = 0 # frames returned so far
+
+    def add(self, time, pitch, power):
+        """ Add the next tracker frame. Returns a list of the frames that are now final. """
+        n = self.base + len(self.raw)
+        self.times.append(time)
+        self.raw.append(pitch)
+        self.power.append(power)
+        self.update_statistics(n)
+        return self.advance(n - (self.lookahead - self.local_width - 5), n)
+
+    def finish(self):
+        """ Clean and return every frame still held back, using whatever lookahead there is """
+        n = self.base + len(self.raw) - 1
+        return self.advance(n, n)
+
+    def update_statistics(self, n):
+        pitch, power = self.raw[n-self.base], self.power[n-self.base]
+        self.powers.add(power)
+        count = len(self.powers)
+        self.high_power = self.powers.rank(count-1-count//20) if count > 0 else 0
+        self.drift.add(pitch, power)
+        self.drift_power += power
+        if n >= self.drift_size:
+            old = n-self.drift_size-self.base
+            self.drift.remove(self.raw[old], self.power[old])
+            self.drift_power -= self.power[old]
+        if pitch > 0:
+            self.voiced.add(pitch, power)
+            self.mid_pitch = self.voiced.mode()
+        # unvoiced or quiet windows keep the last good drift
+        self.max_drift_power = max(self.max_drift_power, self.drift_power)
+        mode = self.drift.mode()
+        if mode > 0 and self.drift_power >= self.max_drift_power/10:
+            # a trailing window can settle on an octave error, which the frames folded against it would then
+            # follow: keep the drift within just under an octave of the global mode
+            while mode < self.mid_pitch/1.9:
+                mode *= 2
+            while mode > self.mid_pitch*1.9:
+                mode /= 2
+            self.drift_pitch = mode
+
+    def advance(self, newest, last):
+        """ Run the first pass up to frame newest, and each later pass as far as its lookahead allows.
+        last is the newest frame added: frames past it count as missing rather than pending. """
+        for j in range(self.base + len(self.folded), newest+1):
+            self.folded.append(self.fold_global(j))
+        newest = newest-self.local_width if newest < last else last
+        for j in range(self.base + len(self.local), newest+1):
+            self.local.append(self.fold_local(j, last))
+        newest = newest-3 if newest < last else last
+        for j in range(self.base + len(self.filled), newest+1):
+            self.filled.append(self.fill_gap(j, last))
+        newest = newest-2 if newest < last else last
+        done = []
+        for j in range(self.released, newest+1):
+            done.append( (self.times[j-self.base], self.smooth(j, last), self.power[j-self.base]) )
+        self.released = max(self.released, newest+1)
+        self.trim(last)
+        return done
+
+    def fold_global(self, j):
+        """ Zero low-power frames, then bring the pitch to within an octave of the drift """
+        p = self.raw[j-self.base]
+        if self.power[j-self.base] < self.high_power/50:
+            return 0
+        while p > 0 and p < self.drift_pitch*0.66:
+            p *= 2
+        while self.drift_pitch > 0 and p > self.drift_pitch*1.5:
+            p /= 2
+        return p
+
+    def fold_local(self, j, last):
+        """ As PitchContour: compare against the power-weighted median of the neighbouring frames,
+        taking finished local values behind this frame and globally folded ones ahead of it """
+        p = self.folded[j-self.base]
+        if p == 0:
+            return 0
+        neighbours = []
+        for k in range(max(self.base, j-self.local_width), min(last, j+self.local_width)+1):
+            if self.folded[k-self.base] > 0 and (k >= j or self.local[k-self.base] > 0):
+                neighbours.append(k)
+        neighbours.sort(key=lambda k: self.power[k-self.base]) # stable: ties keep frame order
+        support = sum(float(self.power[k-self.base]) for k in neighbours)
+        half = support/2
+        median = neighbours[-1]
+        for k in neighbours:
+            half -= self.power[k-self.base]
+            if half <= 0:
+                median = k
+                break
+        estimate = self.local[median-self.base] if median < j else self.folded[median-self.base]
+        if estimate == 0 or support < self.high_power/8:
+            return 0
+        if p/estimate < 0.8:
+            while p/estimate < 0.66:
+                p *= 2
+        elif p/estimate > 1.25:
+            while p/estimate > 1.5:
+                p /= 2
+        return p
+
+    def fill_gap(self, j, last):
+        """ Interpolate a zero frame from the nearest voiced frames either side, if close and similar """
+        p = self.local[j-self.base]
+        if p != 0:
+            return p
+        df = 1
+        while j-df >= self.base and self.local[j-df-self.base] == 0 and df < 4:
+            df += 1
+        db = 1
+        while j+db <= last and self.local[j+db-self.base] == 0 and df+db < 4:
+            db += 1
+        if df+db > 4 or j-df < self.base or j+db > last:
+            return 0
+        forward, back = self.local[j-df-self.base], self.local[j+db-self.base]
+        if forward == 0 or back == 0 or forward/back < 0.66 or forward/back > 1.5:
+            return 0
+        return (forward/df + back/db) / (1/df + 1/db)
+
+    def smooth(self, j, last):
+        """ Power-weighted 5-tap triangular smoothing over voiced frames. The first and last two frames pass through. """
+        p = self.filled[j-self.base]
+        if p == 0 or j < 2 or j > last-2:
+            return p
+        tw = 0
+        total = 0
+        for k, w in zip(range(j-2, j+3), (1, 2, 3, 2, 1)):
+            pk = self.filled[k-self.base]
+            pw = self.power[k-self.base]*w
+            total += pk*pw
+            if pk != 0:
+                tw += pw
+        return total/tw
+
+    def trim(self, last):
+        """ Drop frames that no pass, nor the drift window, will look at again """
+        keep = min(self.released-self.local_width-2, last+1-self.drift_size)
+        if keep > self.base:
+            drop = keep-self.base
+            for frames in (self.times, self.raw, self.power, self.folded, self.local, self.filled):
+                del frames[:drop]
+            self.base = keep
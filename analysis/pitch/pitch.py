@@ -1,31 +1,103 @@
 import math
+import numpy as np
+import sig.energy as sen
 
-def similarity(xs, sq_xs, delta, periods=4):
-    """Normalised similarity amonst xs at delta offset"""
+def similarity(xs, sq_xs, delta, periods=4, energy=None, offset=0):
+    """Normalised similarity amonst xs at delta offset.
+    If given, energy is a SignalEnergy over the signal that xs starts at offset within"""
     corr = 0
     sq = 0
     start = (len(xs) - delta*(periods+1))//2
     if start < 0:
         start = 0
     end = min(len(xs)-delta,len(xs)-start)
-    for i in range(start,end):
-        corr += xs[i]*xs[i+delta]
-        sq += sq_xs[i] + sq_xs[i+delta]
+    if energy is None:
+        for i in range(start,end):
+            corr += xs[i]*xs[i+delta]
+            sq += sq_xs[i] + sq_xs[i+delta]
+    else:
+        for i in range(start,end):
+            corr += xs[i]*xs[i+delta]
+        sq = int(energy.energy(offset+start,offset+end) + energy.energy(offset+start+delta,offset+end+delta))
+    if sq == 0: # digital silence: no similarity to speak of
+        return -math.inf, 0.0
     return 2*corr/sq, math.sqrt(sq/(end-start))
 
-def get_notes(xs, deltas, periods=4):
+def get_notes(xs, deltas, periods=4, energy=None, offset=0):
     """Gets similarity at each delta, assuming deltas are in descending order"""
     xs = [int(x) for x in xs] #increase bits to avoid overflow
-    sq_xs = [x*x for x in xs]
+    sq_xs = [x*x for x in xs] if energy is None else None
     similarities = []
     power = []
     for delta in deltas:
-        s,p = similarity(xs,sq_xs,delta,periods)
+        s,p = similarity(xs,sq_xs,delta,periods,energy,offset)
         similarities.append(s)
         power.append(p)
     #reduce_harmonics(similarities)
     return similarities, power
 
+def get_notes_numpy(xs, deltas, periods=4, energy=None, offset=0):
+    """Array version of get_notes: one dot product and two cumulative sum lookups per delta"""
+    xs = np.asarray(xs).astype(np.int64) # same truncation and overflow headroom as int()
+    n = len(xs)
+    if energy is None:
+        energy = sen.SignalEnergy(xs)
+        offset = 0
+    similarities = []
+    power = []
+    for delta in deltas:
+        start = max(0, (n - delta*(periods+1))//2)
+        end = min(n-delta, n-start)
+        corr = int(np.dot(xs[start:end], xs[start+delta:end+delta]))
+        sq = int(energy.energy(offset+start,offset+end) + energy.energy(offset+start+delta,offset+end+delta))
+        similarities.append(2*corr/sq if sq > 0 else -math.inf)
+        power.append(math.sqrt(sq/(end-start)))
+    return similarities, power
+
+def get_notes_frames(xs, offsets, window_size, deltas, periods=4, energy=None, chunk_size=1<<16):
+    """Similarity and power for every frame starting at offsets (ascending), as (frames x deltas) arrays.
+    Each frame gives the same values as get_notes(xs[offset:offset+window_size]).
+    Frames are taken in chunks starting within chunk_size samples of each other, so memory follows chunk_size
+    rather than the length of xs. energy, if given, is used for the chunks it covers."""
+    offsets = np.asarray(offsets)
+    deltas = np.asarray(deltas)
+    similarities = np.empty((len(offsets), len(deltas)))
+    power = np.empty((len(offsets), len(deltas)))
+    a = 0
+    while a < len(offsets):
+        b = max(a+1, int(np.searchsorted(offsets, offsets[a]+chunk_size)))
+        start, end = offsets[a], offsets[b-1]+window_size
+        if energy is None or not energy.covers(start, end):
+            chunk_energy = sen.SignalEnergy(xs, start, end)
+        else:
+            chunk_energy = energy
+        similarities[a:b], power[a:b] = chunk_notes(xs[start:end], offsets[a:b]-start, window_size, deltas, periods,
+                                                    chunk_energy, start)
+        a = b
+    return similarities, power
+
+def chunk_notes(xs, offsets, window_size, deltas, periods, energy, offset):
+    """get_notes_frames for frames within xs, which starts at offset in the signal energy sums"""
+    xs = np.asarray(xs).astype(np.int64)
+    # the same in-frame span as similarity, per delta
+    starts = np.maximum(0, (window_size - deltas*(periods+1))//2)
+    ends = np.minimum(window_size-deltas, window_size-starts)
+    # energy: cumulative squares, looked up per frame and delta
+    lo = offsets[:,None] + starts[None,:]
+    hi = offsets[:,None] + ends[None,:]
+    sq = energy.energy(offset+lo,offset+hi) + energy.energy(offset+lo+deltas,offset+hi+deltas)
+    # correlation: cumulative lagged products, one pass over the chunk per delta
+    corr = np.empty(sq.shape, dtype=np.int64)
+    cprod = np.zeros(len(xs)+1, dtype=np.int64)
+    for j, delta in enumerate(deltas):
+        np.cumsum(xs[:-delta]*xs[delta:], out=cprod[1:len(xs)-delta+1])
+        corr[:,j] = cprod[hi[:,j]] - cprod[lo[:,j]]
+    # digital silence has no similarity to speak of
+    with np.errstate(divide='ignore', invalid='ignore'):
+        similarities = np.where(sq > 0, 2*corr/sq, -np.inf)
+    power = np.sqrt(sq/(ends-starts))
+    return similarities, power
+
 # the "notes" are just discrete pitch values to test from 65 to 550Hz
 note_names = ["C2", "C#2","D2","D#2","E2","F2","F#2","G2","G#2","A2","Bb2","B2",  "C3","C#3","D3","D#3","E3","F3","F#3","G3","G#3","A3","Bb3","B3",  "C4","C#4","D4","D#4","E4","F4","F#4","G4","G#4","A4","Bb4","B4",  "C5","C#5","Others"]
 notes = [65.41,69.3,73.42,77.78,82.41,87.31,92.5,98,103.83,110.0,116.54,123.47,  130.81,138.59,146.83,155.56,164.81,174.61,185.0,196.0,207.65,220.0,233.08,246.94,  261.625,277.1826,293.6684,311.1270,329.6276,349.2282,369.9944,391.9954,415.3047,440.0,466.1638,493.8833,  523.2511,554.3653,  587.3295]
@@ -0,0 +1,197 @@
+import math
+import numpy as np
+
+# Incrementally updated statistics over a sliding window of contour frames.
+
+class RollingWeightedMedian:
+    """ Weighted median over a changing set of frame positions, ordered by a fixed key per frame.
+    Keys never change, so frames are ranked once up front and the window is held as Fenwick trees
+    of weight and count over those ranks: adding, removing and querying are all O(log n). """
+    def __init__(self, keys, weights=None):
+        if weights is None:
+            weights = keys
+        self.weights = [float(w) for w in weights]
+        n = len(self.weights)
+        # ties in key keep position order, as a stable sort would
+        self.order = sorted(range(n), key=lambda j: keys[j])
+        self.rank = [0]*n
+        for r, j in enumerate(self.order):
+            self.rank[j] = r
+        self.size = n
+        self.weight_tree = [0.0]*(n+1)
+        self.count_tree = [0]*(n+1)
+        self.present = [False]*n
+        self.count = 0
+        self.total = 0.0
+        self.top = 1 << max(0, n.bit_length()-1)
+
+    def __contains__(self, pos):
+        return self.present[pos]
+
+    def update(self, pos, sign):
+        w = self.weights[pos]*sign
+        r = self.rank[pos]+1
+        while r <= self.size:
+            self.weight_tree[r] += w
+            self.count_tree[r] += sign
+            r += r & -r
+        self.present[pos] = sign > 0
+        self.count += sign
+        self.total += w
+
+    def add(self, pos):
+        if not self.present[pos]:
+            self.update(pos, 1)
+
+    def discard(self, pos):
+        if self.present[pos]:
+            self.update(pos, -1)
+
+    def clear(self):
+        self.weight_tree = [0.0]*(self.size+1)
+        self.count_tree = [0]*(self.size+1)
+        self.present = [False]*self.size
+        self.count = 0
+        self.total = 0.0
+
+    def nth(self, k):
+        """ Position of the k-th (1-based) present frame in key order """
+        r = 0
+        step = self.top
+        while step:
+            if r+step <= self.size and self.count_tree[r+step] < k:
+                r += step
+                k -= self.count_tree[r]
+            step >>= 1
+        return self.order[r]
+
+    def median(self):
+        """ Position of the first present frame, in key order, at which the cumulative weight reaches half
+        the total. None when nothing is present. """
+        if self.count == 0:
+            return None
+        if self.total <= 0:
+            return self.nth(1)
+        r = 0
+        remaining = self.total/2
+        step = self.top
+        while step:
+            if r+step <= self.size and self.weight_tree[r+step] < remaining:
+                r += step
+                remaining -= self.weight_tree[r]
+            step >>= 1
+        if r < self.size and self.present[self.order[r]]:
+            return self.order[r]
+        # rounding stopped between present frames: take the next one, or the last
+        return self.nth(min(self.count, self.count_before(r)+1))
+
+    def count_before(self, r):
+        """ Number of present frames ranked below r """
+        count = 0
+        while r > 0:
+            count += self.count_tree[r]
+            r -= r & -r
+        return count
+
+class SlidingWeightedMedian(RollingWeightedMedian):
+    """ RollingWeightedMedian over a window of positions, start to end inclusive, moved along by slide().
+    A position joins when the window reaches it, if include(position) holds then. """
+    def __init__(self, keys, include, weights=None):
+        super().__init__(keys, weights)
+        self.include = include
+        self.start, self.end = 0, -1
+
+    def slide(self, start, end):
+        if start < self.start or end < self.end:
+            # moving backwards: start again
+            self.clear()
+            self.start, self.end = start, start-1
+        while self.end < end:
+            self.end += 1
+            if self.end >= self.start and self.include(self.end):
+                self.add(self.end)
+        while self.start < start:
+            self.discard(self.start)
+            self.start += 1
+
+class RollingMode:
+    """ Weighted mode of a changing multiset of pitch values, binned on a fixed grid (e.g. pitch.make_notes).
+    Adding or removing is one update of a flat list of bin totals; mode() scans the bins added to so far,
+    in the order they were first added to, so ties go to the earliest as with a max over a dictionary. """
+    def __init__(self, grid):
+        self.bins = {}
+        for value in grid:
+            self.bins.setdefault(value, len(self.bins))
+        self.values = list(self.bins)
+        self.counts = [0]*len(self.values)
+        self.added = [False]*len(self.values)
+        self.order = [] # bins in the order first added to
+
+    def add(self, value, weight):
+        b = self.bins[value]
+        if not self.added[b]:
+            self.added[b] = True
+            self.order.append(b)
+            self.values[b] = value # reported as first added, as a dictionary keeps its first key
+        self.counts[b] += weight
+
+    def remove(self, value, weight):
+        self.add(value, -weight)
+
+    def add_all(self, values, weights):
+        """ add() for each value and weight in turn """
+        bins, counts, added = self.bins, self.counts, self.added
+        for value, weight in zip(values, weights):
+            b = bins[value]
+            if not added[b]:
+                added[b] = True
+                self.order.append(b)
+                self.values[b] = value
+            counts[b] += weight
+
+    def slide(self, leaving, leaving_weights, entering, entering_weights):
+        """ remove() the leaving values and add() the entering ones, alternately as a window moves a frame at a time """
+        bins, counts, added = self.bins, self.counts, self.added
+        for old, old_weight, value, weight in zip(leaving, leaving_weights, entering, entering_weights):
+            counts[bins[old]] -= old_weight
+            b = bins[value]
+            if not added[b]:
+                added[b] = True
+                self.order.append(b)
+                self.values[b] = value
+            counts[b] += weight
+
+    def mode(self):
+        return self.values[max(self.order, key=self.counts.__getitem__)]
+
+class QuantileSketch:
+    """ Approximate quantiles of a growing set of positive values, counted in log-spaced bins.
+    Memory depends only on the range of values, and answers are within a relative accuracy. """
+    def __init__(self, accuracy=0.01):
+        self.log_gamma = math.log((1+accuracy)/(1-accuracy))
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.low = 0 # bin of counts[0]
+        self.count = 0
+
+    def add(self, value):
+        if value <= 0:
+            return
+        b = math.floor(math.log(value)/self.log_gamma)
+        if len(self.counts) == 0:
+            self.low = b
+            self.counts = np.zeros(1, dtype=np.int64)
+        elif b < self.low:
+            self.counts = np.concatenate((np.zeros(self.low-b, dtype=np.int64), self.counts))
+            self.low = b
+        elif b >= self.low+len(self.counts):
+            self.counts = np.concatenate((self.counts, np.zeros(b-self.low-len(self.counts)+1, dtype=np.int64)))
+        self.counts[b-self.low] += 1
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def rank(self, r):
+        """ Approximately the r-th (0-based) smallest value added """
+        b = int(np.searchsorted(np.cumsum(self.counts), r, side='right'))
+        return 2*math.exp((self.low+b+1)*self.log_gamma) / (1+math.exp(self.log_gamma))
@@ -1,12 +1,19 @@
 import pitch.pitch as anp
+import sig.energy as sen
 import numpy as np
 import math
-import scipy.io.wavfile as wavfile 
+import os
+import concurrent.futures
+import sig.audio as audio
 
 class PitchTracker:
-  def __init__(self, analysis_frequency):
+  def __init__(self, analysis_frequency, vectorised=False, block_size=1<<16):
     self.analysis_frequency = analysis_frequency
     self.sampling_rate = 0
+    # frames are analysed in blocks starting within this many samples, each with its own energy sums
+    self.block_size = block_size
+    # the numpy engine gives identical similarities, just much faster
+    self.get_notes = anp.get_notes_numpy if vectorised else anp.get_notes
 
   def setup(self,sampling_rate, note_factor=1):
     if sampling_rate == self.sampling_rate:
@@ -17,38 +24,155 @@ class PitchTracker:
     self.step_size = math.ceil(sampling_rate/self.analysis_frequency)
     self.window_size = sampling_rate//5 # want to capture as low as 60Hz, over 6 pitch periods
 
-  def analyse_frame(self,xs):
-    """Given a frame of raw numbers, find approximate pitch and power"""
-    ns,power = anp.get_notes(xs,self.deltas,6) # use 6 pitch periods
+  def analyse_frame(self,xs,energy=None,offset=0):
+    """Given a frame of raw numbers, find approximate pitch and power.
+    Energy, if given, indexes the whole signal and the frame starts at offset"""
+    ns,power = self.get_notes(xs,self.deltas,6,energy,offset) # use 6 pitch periods
     # TODO: estimate the voicing based on similarity
     # just take the best note
     best = max(enumerate(ns),key=lambda x:x[1])[0]
-    if best >= len(self.notes)-1:
-        # too high. Basically no pitch present.
+    if best >= len(self.notes)-1 or ns[best] == -math.inf:
+        # too high, or silent. Basically no pitch present.
         return 0,power[-1]
     return self.notes[best], power[best]
 
+  def centre_size(self, pitch):
+    """Size of the region at the centre of a frame used for its power"""
+    if pitch == 0:
+        return self.window_size // 5 # a small local region
+    return int(min(self.window_size,(3*self.sampling_rate)//pitch))
+
   def track(self,filename):
     """ Produce a time/pitch/power track from a mono wav file """
+    sampling_rate, data = audio.load(filename)
+    return self.track_signal(data,sampling_rate)
+
+  def track_signal(self,data,sampling_rate):
+    """ As track, for samples already loaded (e.g. by sig.audio.load) """
     offset = 0
-    sampling_rate, data = wavfile.read(filename)
     self.setup(sampling_rate,1)
+    energy = None
     while offset + self.window_size < len(data):
+      if energy is None or not energy.covers(offset, offset+self.window_size):
+        # sums for the next block of frames, overlapping the last by a window
+        energy = sen.SignalEnergy(data, offset, min(len(data), offset+self.block_size+self.window_size))
       frame = data[offset:offset+self.window_size]
-      pitch,power = self.analyse_frame(frame)
+      pitch,power = self.analyse_frame(frame,energy,offset)
       # update the power based on three pitch periods from the centre
-      if pitch == 0:
-          centre_size = len(frame) // 5 # a small local region
-      else:
-          centre_size = int(min(len(frame),(3*self.sampling_rate)//pitch))
+      centre_size = self.centre_size(pitch)
       if centre_size == 0:
           power = 0
       else:
-          centre = frame[(len(frame)-centre_size)//2 : (len(frame)+centre_size)//2]
-          power = sum(abs(x) for x in centre) / centre_size
+          start = offset + (self.window_size-centre_size)//2
+          power = energy.abs_sum(start, start+centre_size) / centre_size
       yield float(offset+self.window_size/2)/self.sampling_rate, pitch, power, 0
       offset += self.step_size
 
+  def track_stream(self,chunks,sampling_rate):
+    """ As track, but over an iterable of sample chunks, e.g. blocks from a pipe, socket or sig.audio.read_blocks.
+    Only a ring buffer of one window is kept, however long the input """
+    self.setup(sampling_rate,1)
+    ring = None
+    received = 0 # samples seen so far
+    offset = 0 # start of the next frame
+    pending = None # a frame is only reported once a sample beyond it arrives, as in track
+    for chunk in chunks:
+      chunk = np.asarray(chunk)
+      if ring is None:
+        ring = np.zeros(self.window_size, dtype=chunk.dtype)
+      i = 0
+      while i < len(chunk):
+        if pending is not None:
+          yield pending
+          pending = None
+        # copy in up to the end of the next frame, wrapping around the ring
+        n = min(len(chunk)-i, offset+self.window_size-received)
+        pos = received % self.window_size
+        first = min(n, self.window_size-pos)
+        ring[pos:pos+first] = chunk[i:i+first]
+        ring[:n-first] = chunk[i+first:i+n]
+        received += n
+        i += n
+        if received == offset + self.window_size:
+          pos = received % self.window_size
+          frame = np.concatenate((ring[pos:], ring[:pos])) # oldest sample first
+          pitch,power = self.analyse_frame(frame)
+          centre_size = self.centre_size(pitch)
+          if centre_size == 0:
+              power = 0
+          else:
+              start = (self.window_size-centre_size)//2
+              power = np.abs(frame[start:start+centre_size].astype(np.int64)).sum() / centre_size
+          pending = (float(offset+self.window_size/2)/self.sampling_rate, pitch, power, 0)
+          offset += self.step_size
+
+  def track_batch(self,filename):
+    """ As track, but analyses every frame at once. Returns arrays of times, pitches, powers and voicing """
+    sampling_rate, data = audio.load(filename)
+    return self.track_batch_signal(data,sampling_rate)
+
+  def track_batch_signal(self,data,sampling_rate):
+    """ As track_batch, for samples already loaded. Frames are analysed together a block at a time,
+    so memory follows block_size rather than the signal length """
+    self.setup(sampling_rate,1)
+    # the same frame offsets visited by track
+    offsets = np.arange(0, len(data)-self.window_size, self.step_size)
+    pitches = np.zeros(len(offsets))
+    powers = np.zeros(len(offsets))
+    frames = max(1, self.block_size//self.step_size) # per block
+    for a in range(0, len(offsets), frames):
+      block = offsets[a:a+frames]
+      start = block[0]
+      segment = data[start:block[-1]+self.window_size]
+      pitches[a:a+frames], powers[a:a+frames] = self.analyse_frames(segment, block-start)
+    times = (offsets+self.window_size/2)/self.sampling_rate
+    return times, pitches, powers, np.zeros(len(offsets))
+
+  def analyse_frames(self,data,offsets):
+    """ Pitches and centre powers of the frames of data starting at offsets """
+    energy = sen.SignalEnergy(data)
+    ns,_ = anp.get_notes_frames(data,offsets,self.window_size,self.deltas,6,energy)
+    best = np.argmax(ns,axis=1)
+    notes = np.asarray(self.notes)
+    # too high, or silent throughout: no pitch
+    silent = np.isneginf(ns[np.arange(len(best)),best])
+    pitches = np.where((best >= len(self.notes)-1) | silent, 0, notes[best])
+    # power based on three pitch periods from the centre, or a small local region if unvoiced
+    centre_sizes = np.full(len(offsets), self.centre_size(0))
+    voiced = pitches > 0
+    centre_sizes[voiced] = np.minimum(self.window_size, (3*self.sampling_rate)//pitches[voiced]).astype(int)
+    starts = offsets + (self.window_size-centre_sizes)//2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        powers = np.where(centre_sizes > 0, energy.abs_sum(starts, starts+centre_sizes) / centre_sizes, 0.0)
+    return pitches, powers
+
+  def track_parallel(self,data,sampling_rate,workers=None):
+    """ As track_batch_signal, with the signal split into segments that are analysed in worker processes.
+    Segments overlap by a window so frames and their times are exactly those of a serial run """
+    self.setup(sampling_rate,1)
+    workers = workers or os.cpu_count()
+    offsets = np.arange(0, len(data)-self.window_size, self.step_size)
+    if len(offsets) == 0:
+      return self.track_batch_signal(data,sampling_rate)
+    # contiguous runs of frames, each with the samples it spans (plus one, as track requires)
+    bounds = np.linspace(0, len(offsets), workers+1).astype(int)
+    segments = [(a,b) for a,b in zip(bounds[:-1],bounds[1:]) if b > a]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+      futures = [pool.submit(track_segment, self.analysis_frequency,
+                             np.asarray(data[offsets[a]:offsets[b-1]+self.window_size+1]), sampling_rate)
+                 for a,b in segments]
+      results = [f.result() for f in futures]
+    pitches = np.concatenate([r[0] for r in results])
+    powers = np.concatenate([r[1] for r in results])
+    voicing = np.concatenate([r[2] for r in results])
+    times = (offsets+self.window_size/2)/self.sampling_rate
+    return times, pitches, powers, voicing
+
+def track_segment(analysis_frequency, data, sampling_rate):
+  """ Worker for track_parallel: pitches, powers and voicing of every frame in a segment """
+  _, pitches, powers, voicing = PitchTracker(analysis_frequency).track_batch_signal(data, sampling_rate)
+  return pitches, powers, voicing
+
 # TODO: guess strong/weak/no voicing boundaries
 # post-polishing: minimise octave-jumping through strongly voiced segments
 # prefer lower octaves through weak voiced regions
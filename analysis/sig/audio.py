@@ -0,0 +1,31 @@
+import numpy as np
+import wave
+import scipy.io.wavfile as wavfile
+
+# reading audio from files, either whole or block by block
+
+def load(filename):
+    """ Sampling rate and samples of a wav file. Samples are memory-mapped rather than read into RAM,
+    so the same zero-copy buffer can be handed to every analysis stage. """
+    return wavfile.read(filename, mmap=True)
+
+sample_types = {1: np.uint8, 2: np.dtype('<i2'), 4: np.dtype('<i4')}
+
+def read_blocks(filename, block_size=4096):
+    """ Generator of sample arrays from a PCM wav file, block_size frames at a time.
+    Multi-channel files give (block_size, channels) arrays. """
+    with wave.open(filename, 'rb') as f:
+        dtype = sample_types[f.getsampwidth()]
+        channels = f.getnchannels()
+        while True:
+            data = f.readframes(block_size)
+            if len(data) == 0:
+                break
+            samples = np.frombuffer(data, dtype=dtype)
+            if channels > 1:
+                samples = samples.reshape(-1, channels)
+            yield samples
+
+def sampling_rate(filename):
+    with wave.open(filename, 'rb') as f:
+        return f.getframerate()
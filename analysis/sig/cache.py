@@ -0,0 +1,73 @@
+import hashlib
+import os
+import numpy as np
+import sig.tracks as tracks
+
+# on-disk cache of pipeline intermediates, keyed by the audio content and the parameters of every stage up to
+# the one cached, so changing a later stage's parameters reuses everything before it
+
+def audio_key(data, sampling_rate):
+    """ Hash of the samples themselves, so renamed or copied files share entries """
+    digest = hashlib.sha1()
+    digest.update(repr((sampling_rate, str(data.dtype), data.shape)).encode())
+    digest.update(np.ascontiguousarray(data).view(np.uint8))
+    return digest.hexdigest()
+
+def stage_key(parent, stage, **params):
+    """ Key for a stage run with the given parameters on the output of the stage keyed by parent """
+    text = repr((parent, stage, sorted(params.items())))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+class ResultCache:
+    """ A directory of .npz files (as written by sig.tracks), one per key. Reading an entry marks it as used,
+    and once the directory passes max_bytes the least recently used entries are removed. """
+    def __init__(self, directory, max_bytes=1<<30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key, kind):
+        """ Columns stored under key as by tracks.load, or None if absent """
+        path = self.path(key)
+        try:
+            columns = tracks.load(path, kind)
+            os.utime(path) # most recently used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return columns
+
+    def save(self, key, kind, sampling_rate=0, **columns):
+        # written under a temporary name then moved into place, so concurrent workers never see half a file
+        temp = os.path.join(self.directory, '%s.%d.tmp.npz' % (key, os.getpid()))
+        tracks.save(temp, kind, sampling_rate, **columns)
+        os.replace(temp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """ Remove least recently used entries until the cache fits in max_bytes """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz') or name.endswith('.tmp.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError: # removed by another process
+                continue
+            entries.append( (stat.st_mtime, stat.st_size, name) )
+        total = sum(e[1] for e in entries)
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
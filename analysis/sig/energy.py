@@ -0,0 +1,37 @@
+import numpy as np
+
+# cumulative sums over a stretch of a loaded signal, so the power or energy of any window in it is two lookups.
+
+class SignalEnergy:
+    """ Sums over signal[start:end], looked up by indices into the whole signal.
+    Callers working along a long (e.g. memory-mapped) signal build one per block of frames, so memory
+    follows the block size rather than the file length. """
+    def __init__(self, signal, start=0, end=None):
+        if end is None:
+            end = len(signal)
+        self.start = start
+        self.end = end
+        xs = np.asarray(signal[start:end]).astype(np.int64) # same truncation as the pitch analysis, no overflow
+        self.abs_sums = np.zeros(len(xs)+1, dtype=np.int64)
+        self.sq_sums = np.zeros(len(xs)+1, dtype=np.int64)
+        np.cumsum(np.abs(xs), out=self.abs_sums[1:])
+        np.cumsum(xs*xs, out=self.sq_sums[1:])
+
+    def __len__(self):
+        return self.end-self.start
+
+    def covers(self, start, end):
+        """Whether [start,end) lies within the summed stretch"""
+        return self.start <= start and end <= self.end
+
+    def energy(self, start, end):
+        """Sum of squares over [start,end). Indices may be arrays"""
+        return self.sq_sums[end-self.start] - self.sq_sums[start-self.start]
+
+    def abs_sum(self, start, end):
+        """Sum of absolute values over [start,end). Indices may be arrays"""
+        return self.abs_sums[end-self.start] - self.abs_sums[start-self.start]
+
+    def power(self, start, end):
+        """Mean absolute value over [start,end)"""
+        return self.abs_sum(start, end) / (end - start)
@@ -1,4 +1,6 @@
 import math
+import itertools
+import numpy as np
 
 def varying_sinusoid(samples, start_power, end_power, freq_change=0.0):
     """ Brute force construction of a modulated sinusoid"""
@@ -59,3 +61,131 @@ def sinusoid_f0(instants, sampling_rate, min_pitch=60):
   return samples
 
 
+
+def varying_sinusoid_array(samples, start_power, end_power, freq_change=0.0):
+    """ varying_sinusoid as a float64 array: phase and power ramps computed for the whole period at once"""
+    freq_change = max(-0.33, min(0.33, freq_change))
+    pos = np.arange(samples)*2.0/samples
+    power = (start_power*(2-pos) + end_power*pos) / 2
+    if freq_change != 0.0:
+        d = 0.5 - np.cos(pos*np.pi)/2
+        pos += 2*d*freq_change
+    return np.cos(pos*np.pi) * power
+
+def write_period(samples, start, period):
+    if start >= 0:
+        samples[start:start+len(period)] = period
+    else:
+        # negative positions wrap around, as they do for sinusoid_f0's list
+        samples[np.arange(start, start+len(period))] = period
+
+def sinusoid_f0_array(instants, sampling_rate, min_pitch=60):
+  """ sinusoid_f0, writing each pitch period into a preallocated float32 buffer """
+  samples = np.zeros(instants[-1][0]+10, dtype=np.float32)
+  prev = (0,0)
+  max_length = sampling_rate//min_pitch
+  did_prev = False
+  last_added = None
+  for n,i in enumerate(instants):
+    length = i[0] - prev[0]
+    if length < max_length:
+      freq = length/sampling_rate
+      end_freq = freq
+      if n < len(instants)-1:
+        next_length = instants[n+1][0]-i[0]
+        if next_length < max_length:
+          end_freq = next_length/sampling_rate
+      if length > 0:
+        write_period(samples, prev[0], varying_sinusoid_array(length, prev[1], i[1], end_freq/freq-1.0))
+      if not did_prev:
+        # if we didn't synthesise the previous pitch period and this has non-zero power...
+        if prev[1] != 0:
+          # add a warm-up pitch period.
+          write_period(samples, prev[0]-length, varying_sinusoid_array(length, 0, prev[1]))
+        if last_added != None and last_added[1] != 0:
+          # do the same for the prior pitch period (if any) with a warm-down
+          write_period(samples, last_added[0], varying_sinusoid_array(length, last_added[1],0))
+      last_added = i
+      did_prev = True
+    else:
+      did_prev = False
+    prev = i
+  return samples
+
+def sinusoid_f0_stream(instants, sampling_rate, block_size=4096, min_pitch=60, max_latency=None):
+  """ sinusoid_f0 as a generator: instants are consumed as they arrive (e.g. from a live analysis) and float32
+  blocks of block_size samples are yielded once no later instant can change them. The final block may be shorter.
+  A warm-down takes the length of the next synthesised pitch period, so it is held back until that period arrives,
+  but for no more than max_latency samples (default 4 of the longest pitch period): after that it is written with
+  the length of the last synthesised period instead. """
+  max_length = sampling_rate//min_pitch
+  if max_latency is None:
+    max_latency = 4*max_length
+  buffer = np.zeros(0, dtype=np.float32)
+  base = 0 # position of buffer[0]
+
+  def write(start, period):
+    nonlocal buffer
+    end = start + len(period)
+    if end - base > len(buffer):
+      buffer = np.concatenate((buffer, np.zeros(end-base-len(buffer), dtype=np.float32)))
+    skip = max(0, base-start) # anything before the stream start (or already sent) is dropped
+    buffer[start+skip-base:end-base] = period[skip:]
+
+  prev = (0,0)
+  did_prev = False
+  last_added = None
+  last_length = 0
+  pending = None # an instant waits for the next, which sets its end frequency
+  current = None
+  for i in itertools.chain(instants, [None]):
+    if pending is None:
+      pending = i
+      continue
+    current, pending = pending, i
+    length = current[0] - prev[0]
+    if length < max_length:
+      freq = length/sampling_rate
+      end_freq = freq
+      if pending is not None:
+        next_length = pending[0]-current[0]
+        if next_length < max_length:
+          end_freq = next_length/sampling_rate
+      if length > 0:
+        write(prev[0], varying_sinusoid_array(length, prev[1], current[1], end_freq/freq-1.0))
+        last_length = length
+      if not did_prev:
+        # if we didn't synthesise the previous pitch period and this has non-zero power...
+        if prev[1] != 0:
+          # add a warm-up pitch period.
+          write(prev[0]-length, varying_sinusoid_array(length, 0, prev[1]))
+        if last_added != None and last_added[1] != 0:
+          # do the same for the prior pitch period (if any) with a warm-down
+          write(last_added[0], varying_sinusoid_array(length, last_added[1],0))
+      last_added = current
+      did_prev = True
+    else:
+      did_prev = False
+    prev = current
+    if pending is None:
+      break
+    # everything before here is final: later periods start at prev, warm-ups at most max_length before it
+    safe = prev[0] if did_prev or prev[1] == 0 else prev[0]-max_length
+    if not did_prev and last_added != None and last_added[1] != 0:
+      if prev[0] - last_added[0] > max_latency:
+        write(last_added[0], varying_sinusoid_array(last_length, last_added[1],0))
+        last_added = (last_added[0], 0) # wound down
+      else:
+        safe = min(safe, last_added[0])
+    while safe - base >= block_size:
+      write(base + block_size, np.zeros(0, dtype=np.float32)) # make sure the block is there
+      yield buffer[:block_size].copy()
+      buffer = buffer[block_size:]
+      base += block_size
+  if current is None:
+    return # no instants at all
+  # the end, 10 samples past the last instant
+  write(prev[0]+10, np.zeros(0, dtype=np.float32))
+  buffer = buffer[:prev[0]+10-base]
+  for start in range(0, len(buffer), block_size):
+    yield buffer[start:start+block_size].copy()
@@ -0,0 +1,76 @@
+import numpy as np
+
+# pipeline intermediates (tracks, contours, instants) stored as columns in .npz files, one array per column,
+# so a later stage can pick them up without re-parsing printed text
+
+def save(filename, kind, sampling_rate=0, **columns):
+    """ Write equal-length columns to an uncompressed .npz, tagged with what they hold """
+    np.savez(filename, kind=np.array(kind), sampling_rate=np.array(sampling_rate),
+             **{name: np.asarray(values) for name, values in columns.items()})
+
+def load(filename, kind):
+    """ Columns of a file written by save, as a dictionary. The file must hold the given kind. """
+    with np.load(filename) as f:
+        found = str(f['kind'])
+        if found != kind:
+            raise ValueError("%s holds a %s, not a %s" % (filename, found, kind))
+        return {name: f[name] for name in f.files if name != 'kind'}
+
+def save_track(filename, times, pitches, powers, voicing, sampling_rate=0):
+    """ PitchTracker output, as from track_batch_signal or collected from track_signal """
+    save(filename, 'track', sampling_rate, times=np.asarray(times, dtype=float), pitches=np.asarray(pitches, dtype=float),
+         powers=np.asarray(powers, dtype=float), voicing=np.asarray(voicing, dtype=float))
+
+def load_track(filename):
+    """ times, pitches, powers, voicing arrays of a saved track """
+    columns = load(filename, 'track')
+    return columns['times'], columns['pitches'], columns['powers'], columns['voicing']
+
+def save_contour(filename, contour, sampling_rate=0):
+    """ The cleaned times, pitch and power of a PitchContour """
+    save(filename, 'contour', sampling_rate, times=np.asarray(contour.times, dtype=float),
+         pitch=np.asarray(contour.pitch, dtype=float), power=np.asarray(contour.power, dtype=float))
+
+def load_contour(filename):
+    """ times, pitch, power arrays of a saved contour. PitchContour.cleaned rebuilds the contour from them. """
+    columns = load(filename, 'contour')
+    return columns['times'], columns['pitch'], columns['power']
+
+def instant_columns(instants):
+    """ Columns for a list of (sample position, strength) instants. Strengths are floats except for the
+    artificial zero-strength instants find_instants adds at region ends, which are ints: which is which is
+    stored too, so they print the same after a round trip. """
+    return {'positions': np.array([i[0] for i in instants], dtype=np.int64),
+            'strengths': np.array([i[1] for i in instants], dtype=float),
+            'integral': np.array([isinstance(i[1], (int, np.integer)) for i in instants], dtype=bool)}
+
+def instant_pairs(columns):
+    """ The (sample position, strength) list back from instant_columns """
+    strengths = columns['strengths'].tolist()
+    if 'integral' in columns:
+        for k in np.flatnonzero(columns['integral']).tolist():
+            strengths[k] = int(strengths[k])
+    return list(zip(columns['positions'].tolist(), strengths))
+
+def write_instants(instants, file=None):
+    """ Instants as text, one "position strength" line each: the main_*.py output format """
+    for i in instants:
+        print(i[0],i[1],file=file)
+
+def save_instants(filename, instants, sampling_rate=0):
+    """ (sample position, strength) pairs from find_instants """
+    save(filename, 'instants', sampling_rate, **instant_columns(instants))
+
+def load_instants(filename):
+    """ Saved instants as a list of (sample position, strength) pairs, ready for sinusoid_f0 """
+    return instant_pairs(load(filename, 'instants'))
+
+def kind(filename):
+    """ What a stored intermediate holds: 'track', 'contour' or 'instants' """
+    with np.load(filename) as f:
+        return str(f['kind'])
+
+def sampling_rate(filename):
+    """ Sampling rate the stored intermediate was made at, 0 if unknown """
+    with np.load(filename) as f:
+        return int(f['sampling_rate'])
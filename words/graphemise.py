@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import re
+import collections
+import lexicon as lex
 
 # Functions to convert a series of English text characters into an ordered
 # sequence of canonical graphemes.
@@ -15,7 +17,11 @@ import re
 #TODO: K/S with 'c' split digraphs. e.g. "faced" (currently word-final cases are ok)
 #     note 'ucu' in 'mucus' vs 'uce' in 'puce'. Exception or rule?
 
-def graphemise_text(text):
+def graphemise_text(text, graphemise_token=None):
+  """Graphemes for a whole text. graphemise_token(word, graphemes so far) converts each whitespace-separated
+  word, defaulting to the exceptions lexicon then the rules below (a GraphemeCache can be passed to memoize them)"""
+  if graphemise_token is None:
+    graphemise_token = graphemise_defixed
   # tokenise into sentences and words, handle various punctuation as breaks
   graphemes = []
   # 1. Split off quotations, flagging start/stop points
@@ -39,14 +45,7 @@ def graphemise_text(text):
           if not first:
             graphemes.append('<WB>')
           first = False
-          # pull prefix/suffix off and graphemise separately
-          prefix,word,suffix = defix_word(word)
-          for pre in prefix:
-              graphemes = graphemes + graphemise_prefix(pre,graphemes)
-          graphemes = graphemes + graphemise_word(word)
-          #print(prefix,word,suffix)
-          for suf in suffix:
-              graphemes = graphemes + graphemise_suffix(suf,graphemes)
+          graphemes.extend(graphemise_token(word, graphemes)) # appended in place: no copying of the text so far
         if not final_phrase:
             graphemes.append(phrases[j+1])
     if not final_sentence:
@@ -56,12 +55,78 @@ def graphemise_text(text):
   # find the grapheme series
   return graphemes
 
+def graphemise_defixed(word, context=(), lexicon=lex.default):
+    """Graphemes for one word with any prefixes and suffixes. context is the graphemes before the word,
+    only consulted when a suffix follows a word that gave no graphemes of its own.
+    Words in the lexicon (if given) skip the rules, as do their stems when a prefix or suffix comes off."""
+    if lexicon is not None:
+        known = lexicon.get(word)
+        if known is not None:
+            return list(known)
+    # pull prefix/suffix off and graphemise separately
+    prefix,word,suffix = defix_word(word)
+    graphemes = []
+    for pre in prefix:
+        graphemes += graphemise_prefix(pre,graphemes)
+    # very short stems (i-s, a-s) are too easily mistaken for a listed word
+    known = lexicon.get(word) if lexicon is not None and (prefix or suffix) and len(word) > 2 else None
+    graphemes += list(known) if known is not None else graphemise_word(word)
+    #print(prefix,word,suffix)
+    for suf in suffix:
+        graphemes += graphemise_suffix(suf,graphemes if graphemes else context)
+    return graphemes
+
+class GraphemeCache:
+    """Memoized graphemise_defixed for bulk text, where the same words come up again and again.
+    Holds the graphemes of up to size words, dropping the least recently used."""
+    def __init__(self, size=1<<16, lexicon=lex.default):
+        self.size = size
+        self.lexicon = lexicon
+        self.words = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, word, context=()):
+        graphemes = self.words.get(word)
+        if graphemes is not None:
+            self.hits += 1
+            self.words.move_to_end(word)
+            return graphemes
+        self.misses += 1
+        try:
+            graphemes = tuple(graphemise_defixed(word, (), self.lexicon))
+        except IndexError:
+            # needed the graphemes before it (or fails regardless): not cacheable
+            return graphemise_defixed(word, context, self.lexicon)
+        self.words[word] = graphemes
+        if len(self.words) > self.size:
+            self.words.popitem(last=False)
+        return graphemes
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def report(self):
+        return "%d words cached, %d hits, %d misses (%.1f%% hit rate)" % (len(self.words), self.hits, self.misses, 100*self.hit_rate())
+
+def graphemise_documents(documents, cache=None):
+    """Generator of grapheme lists for a stream of texts, sharing one GraphemeCache across all of them"""
+    if cache is None:
+        cache = GraphemeCache()
+    for text in documents:
+        yield graphemise_text(text, cache)
+
+undoubled = set('whjqvx') # consonants never doubled before a suffix
+vowels_wr = set('aeiouwr') # no -en or -ed suffix after these
+vowel_letters = set('aeiou')
+
 def defix_word(word):
     suffix = []
     prefix = []
     if word.endswith("es"):
         # check for doubled consonant prior (determine whether to leave an 'e' on the word)???
-        if len(word) > 4 and (word[-3] == word[-4] or word[-3] == 'w' or word[-3] == 'h' or word[-3] == 'j' or word[-3] == 'q' or word[-3] == 'v' or word[-3] == 'x'):
+        if len(word) > 4 and (word[-3] == word[-4] or word[-3] in undoubled):
             # fusses => fuss + s
             word = word[:-2]
         elif word[-3] == 'i':
@@ -77,20 +142,20 @@ def defix_word(word):
     if word.endswith("ly") and len(word) > 4: # actually, should have a vowel (so we know it is a whole word)
         word = word[:-2]
         suffix.insert(0,'ly')
-    if word.endswith("en") and len(word) > 2 and word[-3] != 'a' and word[-3] != 'e' and word[-3] != 'i' and word[-3] != 'o' and word[-3] != 'u' and word[-3] != 'w' and word[-3] != 'r':
+    if word.endswith("en") and len(word) > 2 and word[-3] not in vowels_wr:
         word = word[:-2]
         suffix.insert(0,'en')
     if word.endswith("er"):
         # later vs latter ? we need to keep the "e" in the first case
         # bower vs bower? Bow / Bowe, could go either way. These consonants cannot be doubled
-        if len(word) > 4 and (word[-3] == word[-4] or word[-3] == 'w' or word[-3] == 'h' or word[-3] == 'j' or word[-3] == 'q' or word[-3] == 'v' or word[-3] == 'x'):
+        if len(word) > 4 and (word[-3] == word[-4] or word[-3] in undoubled):
             word = word[:-2]
         elif len(word) > 4 and word[-3] == 'i':
             word = word[-3] + 'y'
         else:
             word = word[:-1]
         suffix.insert(0,'er')
-    if word.endswith("ed") and len(word) > 2 and word[-3] != 'a' and word[-3] != 'e' and word[-3] != 'i' and word[-3] != 'o' and word[-3] != 'u' and word[-3] != 'w' and word[-3] != 'r':
+    if word.endswith("ed") and len(word) > 2 and word[-3] not in vowels_wr:
         if word.endswith("ered"):
           word = word[:-4]
           suffix.insert('d')
@@ -106,10 +171,10 @@ def defix_word(word):
     if word.startswith("re") and len(word) > 4:
         prefix.append('re')
         word = word[2:]
-    if word.startswith("de") and len(word) > 4 and word[2] != 'a' and word[2] != 'e' and word[2] != 'i' and word[2] != 'o' and word[2] != 'u':
+    if word.startswith("de") and len(word) > 4 and word[2] not in vowel_letters:
         prefix.append('de')
         word = word[2:]
-    if word.startswith("pre") and len(word) > 5 and word[3] != 'a' and word[3] != 'e' and word[3] != 'i' and word[3] != 'o' and word[3] != 'u':
+    if word.startswith("pre") and len(word) > 5 and word[3] not in vowel_letters:
         prefix.append('pre')
         word = word[3:]
     return prefix,word,suffix
@@ -180,271 +245,135 @@ def graphemise_word(word):
           graphemes = graphemes + tokens[i] # the consonants
   return graphemes
 
+# Rule tables for graphemise_vowels and graphemise_consonants. Each maps a run of characters to its graphemes;
+# pair tables also give how far the scan moves on, which the single-character tables then continue from.
+
+# vowel runs converted whole
+vowel_words = {"igh": ("AH","EE")} # ignores split digraphs and rhotics
+# a single vowel made long by a split digraph
+vowel_split = {'a': ('A','EE'), 'e': ('EE',), 'i': ('AH','EE'), 'o': ('O','UU'), 'u': ('EE','UU'), 'y': ('AH','EE')}
+# regular digraphs: graphemes, then characters consumed
+vowel_pairs = {
+    'aa': (('AH',), 2), 'ae': (('A','EE'), 2), 'ai': (('A','EE'), 2), 'ao': (('AH','UU'), 2), 'au': (('OR',), 2),
+    'ea': (('EE',), 2), 'ee': (('EE',), 2), 'ei': (('A','EE'), 2), 'eo': (('E','O','UU'), 2), 'eu': (('EE','UU'), 2),
+    'ia': (('AH','EE','AH'), 2), # e.g. liar
+    'ie': (('EE',), 0), 'ii': (('EE',), 2), 'iu': (('EE',), 1),
+    'oa': (('O','UU'), 2), 'oe': (('O','UU'), 2), 'oi': (('OR','EE'), 2), 'oo': (('UU',), 2),
+    # TODO: words like "should" don't have the AH. But "ouch" does. What's the rule? Probably the 'L'.
+    # touch?? <- neither fits. In this case UU is dropped, so leave it for pronunciation to choose one to drop
+    'ou': (('AH','UU'), 2),
+    'ue': (('EE','UU'), 2), 'ui': (('W',), 1), 'uo': (('UU',), 1), 'uu': (('UU',), 1)}
+# the last vowel before an 'r' or a 'w'
+vowel_rhotic = {'a': ('AH',), 'e': ('ER',), 'i': ('ER',), 'o': ('OR',), 'u': ('ER',), 'y': ('ER',)}
+vowel_rounded = {'a': ('OR',), 'e': ('EE',), 'i': ('I',), 'o': ('AH',), 'u': ('UU',), 'y': ('EE',)} # u: examples? Huw?
+# regular vowel graphemes
+vowel_single = {'a': ('A',), 'e': ('E',), 'i': ('I',), 'o': ('O',), 'u': ('AH',), 'y': ('EE',)}
+# y at the beginning is a liquid (merged into EE). Otherwise a long EE, with an AH if no vowel came before it:
+# we have two choices, e.g. dowry vs wry, Polly vs Ply
+vowel_leading = {'y': ('EE',)}
+vowel_alone = {'y': ('AH','EE')}
+
 def graphemise_vowels(token, split_digraphed=False,rhotic=False,rounded=False,final=False):
-    """ The sausage factory of low level rules"""
-    if token == "igh":
-        return ["AH","EE"] # ignores split digraphs and rhotics
-    
+    """ The sausage factory of low level rules, as tables above applied in one scan"""
+    if token in vowel_words:
+        return list(vowel_words[token])
+
     # trailing 'e' at the end of a word are ignored. Usually have been added for split digraphs
-    if final and len(token) == 1 and token[0] == 'e':
+    if final and token == 'e':
         return []
-    
-    graphemes = []
+
     if split_digraphed and len(token) == 1:
         # modify the first vowel token and add it in
-        if token[0] == 'a':
-            graphemes.append('A')
-            graphemes.append('EE') # ay
-        elif token[0] == 'e':
-            graphemes.append('EE')
-        elif token[0] == 'i':
-            graphemes.append('AH')
-            graphemes.append('EE') #ai
-        elif token[0] == 'o':
-            graphemes.append('O')
-            graphemes.append('UU')
-        elif token[0] == 'u':
-            graphemes.append('EE') # was Y
-            graphemes.append('UU')
-        elif token[0] == 'y':
-            graphemes.append('AH')
-            graphemes.append('EE') #ai
-        #token = token[1:]
-        return graphemes
-    # run up to the end 
+        return list(vowel_split.get(token, ()))
+    graphemes = []
+    # run up to the end
+    n = len(token)
     i = 0
-    vowel_count = 0
-    while i < len(token):
-        # find any regular digraphs
-        if i < len(token)-1:
-            c = token[i]
-            nc = token[i+1]
-            # peek
-            if c == 'a':
-                if nc == 'a':
-                    graphemes.append('AH')
-                    i += 2
-                elif nc == 'e':
-                    graphemes.append('A')
-                    graphemes.append('EE') #ay
-                    i += 2
-                elif nc == 'i':
-                    graphemes.append('A')
-                    graphemes.append('EE') #ay
-                    i += 2
-                elif nc == 'o':
-                    graphemes.append('AH')
-                    graphemes.append('UU') #au
-                    i += 2
-                elif nc == 'u':
-                    graphemes.append('OR')
-                    i += 2
-                vowel_count += 1
-            elif c == 'e':
-                if nc == 'a' or nc == 'e':
-                    graphemes.append('EE')
-                    i += 2
-                elif nc == 'i':
-                    graphemes.append('A')
-                    graphemes.append('EE') #ay
-                    i += 2
-                elif nc == 'o':
-                    graphemes.append('E')
-                    graphemes.append('O')
-                    graphemes.append('UU')
-                    i += 2
-                elif nc == 'u':
-                    graphemes.append('EE')
-                    graphemes.append('UU')
-                    i += 2
-                vowel_count += 1
-            elif c == 'i':
-                if nc == 'a':
-                    graphemes.append('AH') #e.g. liar
-                    graphemes.append('EE')
-                    graphemes.append('AH')
-                    i += 2
-                elif nc == 'e':
-                    graphemes.append('EE')
-                elif nc == 'i':
-                    graphemes.append('EE')
-                    i += 2
-                elif nc == 'u':
-                    graphemes.append('EE')
-                    i += 1
-                vowel_count += 1
-            elif c == 'o':
-                if nc == 'a' or nc == 'e': 
-                    graphemes.append('O')
-                    graphemes.append('UU')
-                    i += 2
-                elif nc == 'i':
-                    graphemes.append('OR')
-                    graphemes.append('EE')
-                    i += 2
-                elif nc == 'o':
-                    graphemes.append('UU')
-                    i += 2
-                elif nc == 'u':
-                    # TODO: words like "should" don't have the AH. 
-                    # but "ouch" does. What's the rule? Probably the 'L'. 
-                    # found, 
-                    # touch?? <- neither fits. In this case UU is dropped
-                    # so.. leave it for pronunciation to choose one to drop
-                    graphemes.append('AH')
-                    graphemes.append('UU') #au
-                    i += 2
-                vowel_count += 1
-            elif c == 'u':
-                if nc == 'e':
-                    graphemes.append('EE')
-                    graphemes.append('UU')
-                    i += 2
-                elif nc == 'i':
-                    graphemes.append('W')
-                    i += 1
-                elif nc == 'o' or nc == 'u':
-                    graphemes.append('UU')
-                    i += 1
-                vowel_count += 1
-        if i >= len(token):
+    voweled = False # any vowel sound so far
+    while i < n:
+        if i < n-1:
+            pair = vowel_pairs.get(token[i:i+2])
+            voweled = voweled or token[i] in vowel_letters # whether or not a pair matched
+            if pair is not None:
+                graphemes += pair[0]
+                i += pair[1]
+        if i >= n:
             break
-
         c = token[i]
-
-        # if we're at the end apply a rhotic if necessary
-        if rhotic and i == len(token)-1:
-            if c == 'a':
-                graphemes.append('AH')
-            elif c == 'e' or c == 'i' or c == 'u' or c == 'y':
-                graphemes.append('ER')
-            elif c == 'o':
-                graphemes.append('OR')
+        # if we're at the end apply a rhotic or a lip rounding if necessary
+        if rhotic and i == n-1:
+            graphemes += vowel_rhotic.get(c, ())
             return graphemes
-        # or a lip rounding
-        if rounded and i == len(token)-1:
-            if c == 'a':
-                graphemes.append('OR')
-            elif c == 'e':
-                graphemes.append('EE')
-            elif c == 'i':
-                graphemes.append('I') # no change
-            elif c == 'o':
-                graphemes.append('AH')
-            elif c == 'u':
-                graphemes.append('UU') # examples? Huw?
-            elif c == 'y':
-                graphemes.append('EE') # ? 
+        if rounded and i == n-1:
+            graphemes += vowel_rounded.get(c, ())
             return graphemes
-
         # otherwise, just a regular vowel grapheme
-        if c == 'a':
-            graphemes.append('A')
-            vowel_count += 1
-        elif c == 'e':
-            graphemes.append('E')
-            vowel_count += 1
-        elif c == 'i':
-            graphemes.append('I')
-            vowel_count += 1
-        elif c == 'o':
-            graphemes.append('O')
-            vowel_count += 1
-        elif c == 'u':
-            graphemes.append('AH')
-            vowel_count += 1
-        elif c == 'y':
-            # y at the beginning is a liquid, otherwise a long EE
-            if i == 0 and len(token) > 1:
-                graphemes.append('EE') # merge Y and EE
-            else:
-                # we have two choices: e.g. dowry vs wry. Polly vs Ply. <- if no vowels, go with AH EE
-                if vowel_count == 0:
-                    graphemes.append('AH')
-                graphemes.append('EE')
-            vowel_count += 1
+        if i == 0 and n > 1 and c in vowel_leading:
+            graphemes += vowel_leading[c]
+        elif not voweled and c in vowel_alone:
+            graphemes += vowel_alone[c]
+        else:
+            graphemes += vowel_single.get(c, ())
+        voweled = voweled or c in vowel_single
         i += 1
-
     return graphemes
 
+# regular digraphs: graphemes, then characters consumed
+consonant_pairs = {
+    'sh': (('SH',), 2), 'ch': (('T','SH'), 2), 'th': (('TH',), 2), 'zh': (('ZH',), 2), # voiced SH
+    'ng': (('NG',), 2), 'ph': (('F',), 2), 'ss': (('S',), 2),
+    'ck': ((), 1), # just skip the c
+    'kn': ((), 1)} # silent k
+consonant_initial_pairs = {'gn': ((), 1), 'ps': ((), 1)} # silent g, p
+consonant_final_pairs = {'nc': (('N','S'), 2), 'cc': (('K','S'), 2)}
+# single consonants, by context. Anything not listed is its own upper-cased grapheme.
+consonant_before_ia = {'s': ('SH',), 't': ('SH',)} # next vowels io or ia, e.g. tension
+consonant_before_ia_first = {'s': ('ZH',)} # e.g. fusion. But what about motion? Just 'u'?
+consonant_alone = {'s': ('Z',)} # the only consonant between vowels, or at the end
+consonant_medial = {'c': ('S',)} # the only consonant between vowels
+consonant_soft = {'c': ('S',)} # word initial, when followed by ...
+soft_vowels = ('e','i','y','io')
+consonant_single = {'q': ('K','W'), 'x': ('K','S'), 'c': ('K',)}
+
 def graphemise_consonants(token,initial=False,final=False, next_vowel=''):
+    """ Consonant graphemes from the tables above, and whether the token separates vowels, preventing split digraphs """
     #  TODO: consonant modified by: tion, cion(?), sion, tian, sure (SH,SH,ZH non-initial,T+SH non-initial, SH/ZH non-initial)
     graphemes = []
+    n = len(token)
     i = 0
-    separates = False # whether this separates vowels, preventing split digraphs 
-    while i < len(token):
+    separates = False
+    before_ia = next_vowel == 'io' or next_vowel == 'ia'
+    while i < n:
         # find any regular digraphs
-        if i < len(token)-1:
-            c = token[i]
-            nc = token[i+1]
-            if c == 's' and nc == 'h':
-                graphemes.append('SH')
-                i += 2
-            elif c == 'c' and nc == 'h':
-                graphemes.append('T')
-                graphemes.append('SH')
-                i += 2
-            elif c == 't' and nc == 'h':
-                graphemes.append('TH')
-                i += 2
-            elif c == 'z' and nc == 'h':
-                graphemes.append('ZH') # voiced SH
-                i += 2
-            elif c == 'n' and nc == 'g':
-                graphemes.append('NG')
-                i += 2
-            elif c == 'p' and nc == 'h':
-                graphemes.append('F')
-                i += 2
-            elif c == 's' and nc == 's':
-                graphemes.append('S')
-                i += 2
-            elif c == 'c' and nc == 'k':
-                i += 1 # just skip the c
-            elif c == 'k' and nc == 'n':
-                i += 1 # silent k
-            elif initial  and c == 'g' and nc == 'n':
-                i += 1 # silent g
-            elif initial and c == 'p' and nc == 's':
-                i += 1 # silent p
-            elif i == len(token)-2 and c == 'n' and nc == 'c':
-                graphemes.append('N')
-                graphemes.append('S')
-                i += 2
-            elif i == len(token)-2 and c == 'c' and nc == 'c':
-                graphemes.append('K')
-                graphemes.append('S')
-                i += 2
-            elif c == nc:
+        if i < n-1:
+            pair = token[i:i+2]
+            rule = consonant_pairs.get(pair)
+            if rule is None and initial:
+                rule = consonant_initial_pairs.get(pair)
+            if rule is None and i == n-2:
+                rule = consonant_final_pairs.get(pair)
+            if rule is not None:
+                graphemes += rule[0]
+                i += rule[1]
+            elif pair[0] == pair[1]:
                 # collapse any doublings
                 i += 1
                 separates = True
-        if i >= len(token):
-            return graphemes,separates or len(graphemes) > 1
+        if i >= n:
+            break
         c = token[i]
-        if c == 's' and (next_vowel == 'io' or next_vowel == 'ia'):
-            if i == 0:
-                graphemes.append('ZH') # e.g. fusion. But what about motion? Just 'u'?
-            else:
-                graphemes.append('SH') # e.g. tension
-        elif c == 's' and not initial and len(token) == 1:
-            graphemes.append('Z')
-        elif c == 'q':
-            graphemes.append('K')
-            graphemes.append('W')
-        elif c == 'x':
-            graphemes.append('K')
-            graphemes.append('S')
-        elif c == 'c':
-            if ((not initial) and (not final) and len(token) == 1) or (initial and (next_vowel == 'e' or next_vowel == 'i' or next_vowel == 'y' or next_vowel == 'io')):
-                # initial 'c' => S only when followed by 'e' or 'y'
-                graphemes.append('S')
-            else:
-                graphemes.append('K')
-        elif c == 't' and (next_vowel == 'io' or next_vowel == 'ia'):
-            graphemes.append('SH')
+        if before_ia and i == 0 and c in consonant_before_ia_first:
+            graphemes += consonant_before_ia_first[c]
+        elif before_ia and c in consonant_before_ia:
+            graphemes += consonant_before_ia[c]
+        elif not initial and n == 1 and c in consonant_alone:
+            graphemes += consonant_alone[c]
+        elif not initial and not final and n == 1 and c in consonant_medial:
+            graphemes += consonant_medial[c]
+        elif initial and next_vowel in soft_vowels and c in consonant_soft:
+            graphemes += consonant_soft[c]
         else:
-            graphemes.append( token[i].upper() )
+            graphemes += consonant_single.get(c, (c.upper(),))
         i += 1
 
     return graphemes,separates or len(graphemes) > 1
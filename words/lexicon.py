@@ -0,0 +1,148 @@
+import mmap
+import os
+import struct
+
+# Pronunciation lexicons: whole words whose graphemes are given directly rather than found by rule.
+# The text format (as in exceptions.txt) is one word per line followed by its space-separated graphemes.
+# compile_lexicon turns text lexicons into a binary file of sorted string tables, which CompiledLexicon
+# memory-maps and binary searches: no parsing at startup, and one page-cached copy shared between processes.
+
+exceptions_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exceptions.txt')
+compiled_exceptions_file = os.path.splitext(exceptions_file)[0] + '.lex'
+
+# magic, word count, then the word and grapheme byte offset tables (count+1 entries each), then the bytes
+magic = b'LEX1'
+header = struct.Struct('<4sI')
+
+def read_lexicon(filename):
+  """Generator of (word, graphemes) pairs from a lexicon text file. Blank lines and # comments are skipped."""
+  with open(filename) as f:
+    for line in f:
+      fields = line.split()
+      if len(fields) < 2 or fields[0].startswith('#'):
+        continue
+      yield fields[0].lower(), tuple(fields[1:])
+
+def is_compiled(filename):
+  with open(filename, 'rb') as f:
+    return f.read(len(magic)) == magic
+
+def compile_lexicon(output, *filenames):
+  """Write the text lexicons (later ones overriding earlier) as one binary lexicon file"""
+  words = {}
+  for filename in filenames:
+    words.update(read_lexicon(filename))
+  keys = sorted(w.encode() for w in words) # byte order, as the lookups compare
+  values = [' '.join(words[k.decode()]).encode() for k in keys]
+  with open(output, 'wb') as f:
+    f.write(header.pack(magic, len(keys)))
+    for table in (keys, values):
+      offset = 0
+      offsets = [0]
+      for entry in table:
+        offset += len(entry)
+        offsets.append(offset)
+      f.write(struct.pack('<%dI' % len(offsets), *offsets))
+    for table in (keys, values):
+      f.write(b''.join(table))
+
+class CompiledLexicon:
+  """Lookups in a compile_lexicon file, memory-mapped rather than read"""
+  def __init__(self, filename):
+    with open(filename, 'rb') as f:
+      self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    found, self.count = header.unpack_from(self.data, 0)
+    if found != magic:
+      raise ValueError("%s is not a compiled lexicon" % filename)
+    self.word_offsets = header.size
+    self.grapheme_offsets = self.word_offsets + 4*(self.count+1)
+    self.words = self.grapheme_offsets + 4*(self.count+1)
+    self.graphemes = self.words + self.offset(self.word_offsets, self.count)
+
+  def offset(self, table, i):
+    return struct.unpack_from('<I', self.data, table + 4*i)[0]
+
+  def word(self, i):
+    return self.data[self.words + self.offset(self.word_offsets, i) : self.words + self.offset(self.word_offsets, i+1)]
+
+  def get(self, word):
+    """Graphemes for word (any case), or None if not in the lexicon"""
+    key = word.lower().encode()
+    low, high = 0, self.count
+    while low < high:
+      mid = (low+high)//2
+      if self.word(mid) < key:
+        low = mid+1
+      else:
+        high = mid
+    if low == self.count or self.word(low) != key:
+      return None
+    start = self.graphemes + self.offset(self.grapheme_offsets, low)
+    end = self.graphemes + self.offset(self.grapheme_offsets, low+1)
+    return tuple(self.data[start:end].decode().split())
+
+  def __len__(self):
+    return self.count
+
+class Lexicon:
+  """Word -> grapheme tuple lookups over one or more lexicon files, later files overriding earlier ones.
+  Compiled files are memory-mapped; text files are not read until the first lookup, so importing costs nothing
+  however large the files are."""
+  def __init__(self, *filenames):
+    self.filenames = list(filenames)
+    self.tables = None
+
+  def add_file(self, filename):
+    self.filenames.append(filename)
+    self.tables = None # reload with the new file on next lookup
+
+  def load(self):
+    self.tables = []
+    text = {}
+    for filename in self.filenames:
+      if is_compiled(filename):
+        if text:
+          self.tables.append(text)
+          text = {}
+        self.tables.append(CompiledLexicon(filename))
+      else:
+        text.update(read_lexicon(filename))
+    if text:
+      self.tables.append(text)
+
+  def get(self, word):
+    """Graphemes for word (any case), or None if not in the lexicon"""
+    if self.tables is None:
+      self.load()
+    word = word.lower()
+    for table in reversed(self.tables):
+      graphemes = table.get(word)
+      if graphemes is not None:
+        return graphemes
+    return None
+
+  def __contains__(self, word):
+    return self.get(word) is not None
+
+  def __len__(self):
+    """Entries across all files (a word listed in more than one counts more than once)"""
+    if self.tables is None:
+      self.load()
+    return sum(len(table) for table in self.tables)
+
+def exceptions_lexicon():
+  """The hand-written exceptions, from their compiled form if it is at least as new as the text"""
+  if os.path.exists(compiled_exceptions_file) and os.path.getmtime(compiled_exceptions_file) >= os.path.getmtime(exceptions_file):
+    return Lexicon(compiled_exceptions_file)
+  return Lexicon(exceptions_file)
+
+# the hand-written exceptions shipped alongside the rules
+default = exceptions_lexicon()
+
+if __name__ == '__main__':
+  import sys
+  if len(sys.argv) < 3:
+    print("Usage:",sys.argv[0],"<output .lex> <lexicon text file>...")
+    print("e.g.",sys.argv[0],compiled_exceptions_file,exceptions_file)
+    sys.exit(0)
+  compile_lexicon(sys.argv[1], *sys.argv[2:])
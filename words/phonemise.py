@@ -1,11 +1,13 @@
+import numpy as np
+
 # Turn the graphemes into feature vectors, roughly corresponding to "standard" phonetic properties
 
 # binary features, in order
-feature_list = ["Vowel","Voiced","Stop","Fricative","Nasal","Labial","Dental","Alveolar","Postalveolar","Dorsal","Rhotic","Glide","Close","Near close","Mid","Open","Front","Back","Rounded"]
+feature_list = ["Vowel","Voiced","Stop","Fricative","Nasal","Labial","Dental","Alveolar","Postalveolar","Dorsal","Rhotic","Glide","Close","Near close","Mid","Near open","Open","Front","Back","Rounded"]
 
 # graphemes per feature
 vowel = ["A","E","I","O","AH","OR","EE","UU","ER"]
-voiced = vowels + ["B","D","G","V","TH","Z","ZH","M","N","NG","L","R","W"]
+voiced = vowel + ["B","D","G","V","TH","Z","ZH","M","N","NG","L","R","W"]
 
 stop = ["P","B","T","D","K","G"]
 fricative = ["F","V","TH","S","Z","SH","ZH","H"]
@@ -29,3 +31,61 @@ back = ["UU","O","OR","AH"]
 # note: ER is neither front nor back (the sole central vowel in this spec. We're making "u" in "hut" a back AH) 
 
 rounded = ["UU","OR","W"]
+
+# graphemes per feature, in feature_list order
+feature_graphemes = [vowel, voiced, stop, fricative, nasal, labial, dental, alveolar, postalveolar, dorsal, rhotic, glide,
+                     close, near_close, mid, near_open, opens, front, back, rounded]
+
+# consonant letters the graphemiser (j) or a lexicon (y, ...) leaves as they are, with the features of what they
+# usually stand for. Clusters (q, x) get the features of both sounds.
+letters = {"J": ["Voiced","Stop","Fricative","Postalveolar"], # D ZH, as in jam
+           "Y": ["Voiced","Dorsal","Glide","Close","Front"], # as in you: a consonant EE
+           "Q": ["Stop","Labial","Dorsal","Glide","Rounded"], # K W
+           "X": ["Stop","Fricative","Alveolar","Dorsal"]} # K S
+aliases = {"C": "K"} # a hard c, as in the exceptions' "because"
+
+# grapheme IDs: word breaks, then every grapheme with features. Anything else (punctuation) gets the last ID,
+# which has no features.
+graphemes = ["<WB>"] + sorted(set(g for gs in feature_graphemes for g in gs) | set(letters))
+grapheme_ids = {g: i for i, g in enumerate(graphemes)}
+grapheme_ids.update((g, grapheme_ids[a]) for g, a in aliases.items())
+unknown_id = len(graphemes)
+
+# one row of 0/1 features per grapheme ID, and the same with each row bit-packed into bytes
+feature_table = np.zeros((unknown_id+1, len(feature_list)), dtype=np.uint8)
+for f, gs in enumerate(feature_graphemes):
+    for g in gs:
+        feature_table[grapheme_ids[g], f] = 1
+for g, features in letters.items():
+    feature_table[grapheme_ids[g], [feature_list.index(f) for f in features]] = 1
+# every grapheme must be told apart from every other (and word breaks, being featureless, from all of them)
+assert len(np.unique(feature_table[:unknown_id], axis=0)) == unknown_id, "graphemes with identical features"
+packed_table = np.packbits(feature_table, axis=1)
+
+def grapheme_indices(sequence):
+    """IDs of a grapheme sequence, e.g. from graphemise_text"""
+    return np.fromiter((grapheme_ids.get(g, unknown_id) for g in sequence), dtype=np.intp, count=len(sequence))
+
+def encode(sequence, packed=False):
+    """(n x features) uint8 matrix of 0/1 features for n graphemes, or (n x 3) with the bits packed"""
+    table = packed_table if packed else feature_table
+    return table[grapheme_indices(sequence)]
+
+def encode_batch(sequences, packed=False):
+    """Features of several grapheme sequences as one (batch x longest x features) array, padded with
+    featureless rows, and the length of each sequence"""
+    lengths = np.array([len(s) for s in sequences], dtype=np.intp)
+    ids = np.full((len(sequences), lengths.max() if len(sequences) > 0 else 0), unknown_id, dtype=np.intp)
+    for row, sequence in zip(ids, sequences):
+        row[:len(sequence)] = grapheme_indices(sequence)
+    table = packed_table if packed else feature_table
+    return table[ids], lengths
+
+if __name__ == '__main__':
+    import sys
+    import graphemise
+    for text in sys.argv[1:]:
+        sequence = graphemise.graphemise_text(text)
+        print(" ".join(feature_list))
+        for g, row in zip(sequence, encode(sequence)):
+            print(g, "".join(str(b) for b in row))